@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+# @module bench_email
+# @desc Throughput benchmark for the email pipeline (broadcasts, invoices and receipts) against a local fake SendGrid
+"""
+Measure the email pipeline throughput (messages per second) and the SendGrid request latencies, sending to the local
+fake SendGrid server (see `benchmarks/fake_sendgrid.py`) instead of the real API.
+
+Run from the project root:
+
+    python -m benchmarks.bench_email                                    # Default recipient counts
+    python -m benchmarks.bench_email --recipients 20000 --documents 500 # Bigger runs
+    python -m benchmarks.bench_email --latency 0.15 --jitter 0.1        # Closer to the real API round trips
+    python -m benchmarks.bench_email --failure-rate 0.05 --scenarios broadcast,invoices
+    python -m benchmarks.bench_email --document-mode link               # Links instead of the pdf attachments
+
+The scenarios:
+
+- `broadcast`: `Message.send_email` to the registrations of an event (resumed until it's sent, when the failures are
+  injected);
+- `invoices` and `receipts`: the `PaymentAdmin.email_invoices` and `email_receipts` actions (rendering the documents
+  and putting the emails to the outbox), then the `send_outbox_emails` worker batches until the outbox is empty (the
+  failed emails are retried at once).
+
+The data is created in a temporary test database (the migrations are applied first, which takes a few seconds), the
+documents and the logs are written to temporary folders. The missing secrets are filled with dummy values.
+"""
+
+import argparse
+import copy
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+
+from requests import RequestException
+
+from .fake_sendgrid import FakeSendGridServer
+
+default_recipients = 5000
+default_documents = 200
+scenarios = ("broadcast", "invoices", "receipts")
+
+dummy_environment = {
+    "DJANGO_SETTINGS_MODULE": "dds_registration.settings",
+    "SECRET_KEY": "benchmark",
+    "REGISTRATION_SALT": "benchmark",
+    "SENDGRID_API_KEY": "benchmark",
+    "STRIPE_PUBLISHABLE_KEY": "benchmark",
+    "STRIPE_SECRET_KEY": "benchmark",
+    "STRIPE_WEBHOOK_SECRET": "benchmark",
+    "SENTRY_DSN": "http://benchmark@localhost/1",
+}
+
+
+def setup_django(server_url: str, document_mode: str):
+    """Configure django to send to the fake server, create the test database"""
+    for key, value in dummy_environment.items():
+        os.environ.setdefault(key, value)
+    os.environ["SENDGRID_API_HOST"] = server_url
+    os.environ["EMAIL_TRANSPORT"] = "dds_registration.core.helpers.email.SendGridTransport"
+    os.environ["DOCUMENT_EMAIL_MODE"] = document_mode
+
+    import django
+    from django.conf import settings
+    from django.test.runner import DiscoverRunner
+    from django.test.utils import setup_test_environment
+
+    # Keep the benchmark logs out of the project log files
+    log_folder = tempfile.mkdtemp(prefix="dds-bench-logs-")
+    logging_config = copy.deepcopy(settings.LOGGING)
+    for handler in logging_config["handlers"].values():
+        if "filename" in handler:
+            handler["filename"] = os.path.join(log_folder, os.path.basename(handler["filename"]))
+    settings.LOGGING = logging_config
+    django.setup()
+    settings.DOCUMENTS_ROOT = tempfile.mkdtemp(prefix="dds-bench-documents-")
+    # The failed outbox emails are retried by the next batch
+    settings.EMAIL_OUTBOX_RETRY_DELAY = 0
+    setup_test_environment()
+    runner = DiscoverRunner(verbosity=0)
+    return runner, runner.setup_databases()
+
+
+class LatencyRecorder:
+    """Wraps the transport `send` to keep the duration of every SendGrid request (successful or not)"""
+
+    def __init__(self, transport):
+        self.send = transport.send
+        self.latencies: list[float] = []
+        transport.send = self
+
+    def __call__(self, mail):
+        started = time.perf_counter()
+        try:
+            self.send(mail)
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+
+
+def create_users(count: int, prefix: str) -> list:
+    from dds_registration.models import User
+
+    User.objects.bulk_create(
+        [
+            User(username=f"{prefix}-{index}@example.org", email=f"{prefix}-{index}@example.org", first_name="Bench")
+            for index in range(count)
+        ]
+    )
+    return list(User.objects.filter(username__startswith=f"{prefix}-").order_by("id"))
+
+
+def create_event(title: str):
+    from dds_registration.models import Event, RegistrationOption
+
+    event = Event.objects.create(
+        title=title, description="Benchmark event", success_email="Registered", registration_close=date(2099, 1, 1)
+    )
+    option = RegistrationOption.objects.create(event=event, item="Shared room", price=250, currency="EUR")
+    return event, option
+
+
+def create_registrations(event, option, users: list, status: str = "REGISTERED") -> list:
+    from dds_registration.models import Registration
+
+    Registration.objects.bulk_create(
+        [Registration(event=event, option=option, user=user, status=status) for user in users]
+    )
+    return list(Registration.objects.filter(event=event).select_related("user").order_by("user_id"))
+
+
+def prepare_broadcast(count: int):
+    from dds_registration.models import Message
+
+    event, option = create_event("Benchmark broadcast")
+    create_registrations(event, option, create_users(count, "broadcast"))
+    return Message.objects.create(event=event, subject="Benchmark update", message="The schedule has changed.\n" * 20)
+
+
+def prepare_payments(scenario: str, count: int):
+    """Event payments (created in bulk, so the documents aren't rendered in advance) for the invoices or receipts"""
+    from dds_registration.models import Payment, Registration
+
+    status = "CREATED" if scenario == "invoices" else "PAID"
+    event, option = create_event(f"Benchmark {scenario}")
+    registrations = create_registrations(event, option, create_users(count, scenario), "PAYMENT_PENDING")
+    payments = Payment.objects.bulk_create(
+        [
+            Payment(
+                status=status,
+                data={
+                    "user": {"id": registration.user.id, "name": "Bench User", "address": "Dorfsteig 8\n5223 Riniken"},
+                    "extra": "",
+                    "kind": "event",
+                    "method": "INVOICE",
+                    "event": {"id": event.id, "title": event.title},
+                    "registration": {"id": registration.id},
+                    "option": {"id": option.id, "item": option.item},
+                    "price": option.price,
+                    "currency": option.currency,
+                    "paid_date": "2024-05-10",
+                },
+            )
+            for registration in registrations
+        ]
+    )
+    for registration, payment in zip(registrations, payments):
+        registration.payment = payment
+    Registration.objects.bulk_update(registrations, ["payment"])
+    return Payment.objects.filter(id__in=[payment.id for payment in payments])
+
+
+def get_admin_request():
+    from django.contrib.messages.storage.fallback import FallbackStorage
+    from django.test import RequestFactory
+
+    request = RequestFactory().post("/admin/dds_registration/payment/")
+    request.session = {}
+    request._messages = FallbackStorage(request)
+    return request
+
+
+def run_broadcast(count: int) -> dict:
+    message = prepare_broadcast(count)
+    started = time.perf_counter()
+    sent = retries = 0
+    while not message.emailed:
+        try:
+            sent += message.send_email()
+        except RequestException:
+            # Resumed from the failed batch
+            retries += 1
+    return {"messages": sent, "seconds": time.perf_counter() - started, "retries": retries}
+
+
+def run_documents(scenario: str, count: int, batch_size: int) -> dict:
+    from django.contrib import admin
+
+    from dds_registration.management.commands.send_outbox_emails import Command
+    from dds_registration.models import OutboxEmail, Payment
+
+    payments = prepare_payments(scenario, count)
+    payment_admin = admin.site._registry[Payment]
+    action = payment_admin.email_invoices if scenario == "invoices" else payment_admin.email_receipts
+
+    started = time.perf_counter()
+    action(get_admin_request(), payments)
+    enqueued = time.perf_counter()
+    worker = Command()
+    sent = retries = 0
+    while OutboxEmail.get_due().exists():
+        batch_sent, batch_failed = worker.send_batch(batch_size)
+        sent += batch_sent
+        retries += batch_failed
+    finished = time.perf_counter()
+    return {
+        "messages": sent,
+        "seconds": finished - started,
+        "enqueue_seconds": enqueued - started,
+        "send_seconds": finished - enqueued,
+        "retries": retries,
+        "abandoned": OutboxEmail.objects.filter(status="FAILED").count(),
+    }
+
+
+def get_percentiles(latencies: list[float]) -> dict:
+    if len(latencies) < 2:
+        value = latencies[0] * 1000 if latencies else 0
+        return {"p50": value, "p95": value, "p99": value, "max": value}
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {"p50": cuts[49] * 1000, "p95": cuts[94] * 1000, "p99": cuts[98] * 1000, "max": max(latencies) * 1000}
+
+
+def format_row(scenario: str, result: dict) -> str:
+    row = "{:<10} {:>6} msgs {:>8.2f} s {:>9.1f} msgs/s {:>5} reqs   p50 {:>7.1f} ms  p95 {:>7.1f} ms  p99 {:>7.1f} ms".format(
+        scenario,
+        result["messages"],
+        result["seconds"],
+        result["messages"] / result["seconds"] if result["seconds"] else 0,
+        result["requests"],
+        result["latency_ms"]["p50"],
+        result["latency_ms"]["p95"],
+        result["latency_ms"]["p99"],
+    )
+    if "enqueue_seconds" in result:
+        row += "   (enqueue {:.2f} s, send {:.2f} s)".format(result["enqueue_seconds"], result["send_seconds"])
+    if result["retries"]:
+        row += f"   {result['retries']} retried"
+    if result.get("abandoned"):
+        row += f", {result['abandoned']} abandoned"
+    return row
+
+
+def parse_list(value: str) -> list[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the email pipeline against a local fake SendGrid server")
+    parser.add_argument("--scenarios", default=",".join(scenarios), help="Scenarios: " + ", ".join(scenarios))
+    parser.add_argument("--recipients", type=int, default=default_recipients, help="Broadcast recipients")
+    parser.add_argument("--documents", type=int, default=default_documents, help="Emailed invoices (receipts)")
+    parser.add_argument("--batch-size", type=int, default=50, help="Outbox worker batch size")
+    parser.add_argument("--document-mode", choices=("attachment", "link"), default="attachment")
+    parser.add_argument("--latency", type=float, default=0.02, help="Fake SendGrid request latency (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.01, help="Max random latency added (seconds)")
+    parser.add_argument("--failure-rate", type=float, default=0, help="Share of the failed SendGrid requests")
+    parser.add_argument("--failure-status", type=int, default=500, help="Status of the failed requests")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed of the fake server")
+    args = parser.parse_args(argv)
+
+    server = FakeSendGridServer(
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        failure_status=args.failure_status,
+        seed=args.seed,
+    ).start()
+    runner, old_config = setup_django(server.url, args.document_mode)
+    from dds_registration.core.helpers.email import get_email_transport
+    from dds_registration.core.helpers.http import get_outbound_stats
+
+    recorder = LatencyRecorder(get_email_transport())
+    print(
+        f"Fake SendGrid at {server.url}: latency {args.latency * 1000:.0f} ms (+{args.jitter * 1000:.0f} ms), "
+        f"failure rate {args.failure_rate:.0%}, documents as {args.document_mode}s",
+        flush=True,
+    )
+    try:
+        for scenario in parse_list(args.scenarios):
+            if scenario not in scenarios:
+                parser.error(f"Unknown scenario: {scenario}")
+            recorder.latencies.clear()
+            server.reset()
+            if scenario == "broadcast":
+                result = run_broadcast(args.recipients)
+            else:
+                result = run_documents(scenario, args.documents, args.batch_size)
+            result["requests"] = server.get_stats()["requests"]
+            result["latency_ms"] = get_percentiles(recorder.latencies)
+            print(format_row(scenario, result), flush=True)
+        print(
+            "SendGrid calls (outbound client): {calls} calls, {failures} failed, p50 {p50_ms} ms, p95 {p95_ms} ms".format(
+                **get_outbound_stats()["sendgrid"]
+            )
+        )
+    finally:
+        runner.teardown_databases(old_config)
+        server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
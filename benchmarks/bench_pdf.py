@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+# @module bench_pdf
+# @desc Benchmarks for the pdf documents rendering (invoices and receipts)
+"""
+Measure the wall time, peak memory and output size of the pdf documents rendering.
+
+Run from the project root:
+
+    python -m benchmarks.bench_pdf                                  # Default batch sizes (1, 10, 100)
+    python -m benchmarks.bench_pdf --sizes 1,10,100,1000            # Full run (takes a while)
+    python -m benchmarks.bench_pdf --save benchmarks/baseline.json  # Store the results as a baseline
+    python -m benchmarks.bench_pdf --compare benchmarks/baseline.json
+
+The documents are rendered from in-memory sample payments, so no database (nor django settings) is required.
+With `--compare` the exit code is 1 if any case became slower (or bigger) than the baseline beyond the tolerance.
+"""
+
+import argparse
+import gc
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import date, datetime
+from importlib.metadata import version
+from pathlib import Path
+from typing import Callable
+
+from dds_registration.core.constants.payments import payment_details_by_currency
+from dds_registration.core.helpers.create_pdf import (
+    create_invoice_pdf_from_payment,
+    create_pdf,
+    create_receipt_pdf_from_payment,
+    get_invoice_pdf_params,
+    output_pdf,
+)
+
+default_sizes = (1, 10, 100)
+default_tolerance = 0.2  # Allowed relative slowdown (or growth) against the baseline
+memory_sample_limit = 100  # Max documents traced for the peak memory (tracing is several times slower)
+
+long_address = "\n".join(
+    [
+        "Department of Environmental Systems Science, Institute for Environmental Decisions",
+        "Ecological Systems Design Group, Room CHN K 78.2",
+        "Universitätstrasse 16",
+        "8092 Zürich",
+        "Switzerland",
+        "VAT CHE-999.999.999",
+    ]
+)
+long_extra = " ".join(
+    [
+        "Purchase order: PO-2024-000123. Cost center: 4711-ENV.",
+        "Please quote the invoice number with the payment, otherwise it can't be matched to the registration.",
+    ]
+    * 4
+)
+
+
+@dataclass
+class SamplePayment:
+    """In-memory stand-in for `Payment`, with the fields used to render its documents"""
+
+    data: dict
+    invoice_no: str = "240001"
+    updated: date = date(2024, 5, 4)
+
+    @property
+    def account(self):
+        return payment_details_by_currency[self.data["currency"]]
+
+
+def make_payment(kind: str, long: bool = False) -> SamplePayment:
+    data = {
+        "kind": kind,
+        "user": {
+            "id": 1,
+            "name": "Maria Sánchez-Oliveira" if not long else "Dr. Maria Antonia Sánchez-Oliveira de la Fuente",
+            "address": "Dorfsteig 8\n5223 Riniken\nSwitzerland" if not long else long_address,
+        },
+        "extra": "" if not long else long_extra,
+        "price": 1224 if kind == "event" else 50,
+        "currency": "EUR",
+        "paid_date": "2024-05-10",
+    }
+    if kind == "event":
+        title = "Autumn School on Open Inventory Data Manipulation"
+        if long:
+            title += "; October 9-13, 2023; Grosshöchstetten, Switzerland (with the excursion and the final workshop)"
+        data["event"] = {"id": 1, "title": title}
+        data["option"] = {"id": 1, "item": "Shared double room" if not long else "Single room with a late check-out"}
+    else:
+        data["membership"] = {"type": "NORMAL", "label": "Normal membership"}
+        data["until"] = 2024
+    return SamplePayment(data)
+
+
+scenarios: dict[str, Callable[[], SamplePayment]] = {
+    "event": lambda: make_payment("event"),
+    "event-long": lambda: make_payment("event", long=True),
+    "membership": lambda: make_payment("membership"),
+    "membership-long": lambda: make_payment("membership", long=True),
+}
+
+member_name = "Maria Sánchez-Oliveira"
+
+
+def get_renderer(target: str, payment: SamplePayment) -> Callable[[], bytes]:
+    """Return the function rendering one document (to the pdf data) for the benchmark target"""
+    if target == "create_pdf":
+        params = get_invoice_pdf_params(payment, member_name=member_name)
+        return lambda: output_pdf(create_pdf(**params))
+    if target == "invoice":
+        return lambda: output_pdf(create_invoice_pdf_from_payment(payment, member_name=member_name))
+    if target == "receipt":
+        return lambda: output_pdf(create_receipt_pdf_from_payment(payment, member_name=member_name))
+    raise ValueError(f"Unknown benchmark target: {target}")
+
+
+targets = ("create_pdf", "invoice", "receipt")
+
+
+def render_batch(render: Callable[[], bytes], size: int) -> int:
+    """Render the batch (dropping the documents, as the exports do), return the total output size"""
+    total = 0
+    for _ in range(size):
+        total += len(render())
+    return total
+
+
+def measure_case(target: str, scenario: str, size: int, repeat: int) -> dict:
+    render = get_renderer(target, scenarios[scenario]())
+    sample = render()  # Warm up (the fonts and images are parsed once per process)
+    # Small batches are repeated to get a stable timing
+    rounds = max(1, min(repeat, 100 // size))
+    timings = []
+    for _ in range(rounds):
+        gc.collect()
+        started = time.perf_counter()
+        output_size = render_batch(render, size)
+        timings.append(time.perf_counter() - started)
+    traced = min(size, memory_sample_limit)
+    gc.collect()
+    tracemalloc.start()
+    render_batch(render, traced)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    best = min(timings)
+    return {
+        "target": target,
+        "scenario": scenario,
+        "size": size,
+        "batch_s": round(best, 4),
+        "median_batch_s": round(statistics.median(timings), 4),
+        "per_doc_ms": round(best / size * 1000, 3),
+        "peak_kib": round(peak / 1024, 1),
+        "peak_traced_docs": traced,
+        "output_bytes": output_size // size,
+        "fonts_embedded": sample.count(b"/FontFile"),
+    }
+
+
+def get_case_key(result: dict) -> str:
+    return "{target}/{scenario}/{size}".format(**result)
+
+
+def get_meta() -> dict:
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "fpdf2": version("fpdf2"),
+        "fonttools": version("fonttools"),
+    }
+
+
+def format_row(result: dict, base: dict | None = None) -> str:
+    row = "{:<38} {:>9.2f} ms {:>10.1f} KiB {:>8} B {:>2} fonts".format(
+        get_case_key(result),
+        result["per_doc_ms"],
+        result["peak_kib"],
+        result["output_bytes"],
+        result.get("fonts_embedded", "?"),
+    )
+    if base:
+        row += "   time x{:.2f}  memory x{:.2f}  size x{:.2f}".format(
+            result["per_doc_ms"] / base["per_doc_ms"],
+            result["peak_kib"] / base["peak_kib"],
+            result["output_bytes"] / base["output_bytes"],
+        )
+    return row
+
+
+def get_regressions(results: list[dict], baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for result in results:
+        base = baseline.get(get_case_key(result))
+        if not base:
+            continue
+        for field in ("per_doc_ms", "peak_kib", "output_bytes"):
+            if result[field] > base[field] * (1 + tolerance):
+                regressions.append(f"{get_case_key(result)}: {field} {base[field]} -> {result[field]}")
+    return regressions
+
+
+def print_size_report(results: list[dict]) -> None:
+    """Output size per document for every target and scenario (it doesn't depend on the batch size)"""
+    print("\nDocument sizes:")
+    seen = set()
+    for result in results:
+        key = (result["target"], result["scenario"])
+        if key in seen:
+            continue
+        seen.add(key)
+        print(
+            "  {:<30} {:>8} B ({:.1f} KiB), {} embedded font(s)".format(
+                "/".join(key), result["output_bytes"], result["output_bytes"] / 1024, result.get("fonts_embedded", "?")
+            )
+        )
+
+
+def parse_list(value: str) -> list[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the pdf documents rendering")
+    parser.add_argument("--sizes", default=",".join(map(str, default_sizes)), help="Batch sizes (comma separated)")
+    parser.add_argument("--targets", default=",".join(targets), help="Rendered functions: " + ", ".join(targets))
+    parser.add_argument("--scenarios", default=",".join(scenarios), help="Payments: " + ", ".join(scenarios))
+    parser.add_argument("--repeat", type=int, default=5, help="Max rounds for the small batches")
+    parser.add_argument("--save", type=Path, help="Store the results (as a baseline) to the json file")
+    parser.add_argument("--compare", type=Path, help="Compare the results with the stored baseline")
+    parser.add_argument("--tolerance", type=float, default=default_tolerance, help="Allowed relative regression")
+    args = parser.parse_args(argv)
+
+    baseline = json.loads(args.compare.read_text())["results"] if args.compare else {}
+    results = []
+    for target in parse_list(args.targets):
+        for scenario in parse_list(args.scenarios):
+            for size in map(int, parse_list(args.sizes)):
+                result = measure_case(target, scenario, size, args.repeat)
+                results.append(result)
+                print(format_row(result, baseline.get(get_case_key(result))), flush=True)
+
+    print_size_report(results)
+
+    if args.save:
+        data = {"meta": get_meta(), "results": {get_case_key(result): result for result in results}}
+        args.save.write_text(json.dumps(data, indent=2) + "\n")
+        print(f"Results saved to {args.save}")
+
+    if args.compare:
+        regressions = get_regressions(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions (beyond {:.0%}):".format(args.tolerance))
+            print("\n".join("  " + regression for regression in regressions))
+            return 1
+        print("No regressions against {}".format(args.compare))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
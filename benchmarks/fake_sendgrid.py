@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# @module fake_sendgrid
+# @desc Local stand-in for the SendGrid mail send API, with the injected latency and failures
+"""
+A local HTTP server answering the SendGrid `POST /v3/mail/send` requests, so the email pipeline can be measured (or
+tried) without sending real emails. Point `SENDGRID_API_HOST` at it:
+
+    python -m benchmarks.fake_sendgrid --port 8025 --latency 0.1 --jitter 0.05 --failure-rate 0.02
+    SENDGRID_API_HOST=http://127.0.0.1:8025 python manage.py send_outbox_emails
+
+Every request waits for the latency (plus a random jitter), then fails with `--failure-status` at the failure rate,
+otherwise is accepted (202, as SendGrid does). The server counts the requests and the recipients (personalizations).
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+send_path = "/v3/mail/send"
+
+
+class FakeSendGridHandler(BaseHTTPRequestHandler):
+    server: "FakeSendGridServer"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path != send_path:
+            self.reply(404, {"errors": [{"message": f"Unknown path: {self.path}"}]})
+            return
+        try:
+            personalizations = len(json.loads(body)["personalizations"])
+        except (ValueError, KeyError, TypeError):
+            self.reply(400, {"errors": [{"message": "Invalid mail data"}]})
+            return
+        self.server.wait()
+        if self.server.should_fail():
+            self.server.count(failed=True)
+            self.reply(self.server.failure_status, {"errors": [{"message": "Injected failure"}]})
+            return
+        self.server.count(personalizations=personalizations)
+        self.reply(202)
+
+    def reply(self, status: int, data: dict | None = None):
+        content = json.dumps(data).encode("utf-8") if data else b""
+        self.send_response(status)
+        if status == 429:
+            self.send_header("Retry-After", "1")
+        if content:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class FakeSendGridServer(ThreadingHTTPServer):
+    """
+    The fake SendGrid server, run in a background thread with `start` (and `stop`) or with `serve_forever`.
+    The port 0 picks a free port (see `url`).
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0,
+        jitter: float = 0,
+        failure_rate: float = 0,
+        failure_status: int = 500,
+        seed: int | None = None,
+        verbose: bool = False,
+    ):
+        super().__init__((host, port), FakeSendGridHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.verbose = verbose
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.thread: threading.Thread | None = None
+        self.reset()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reset(self):
+        with self.lock:
+            self.requests = self.failures = self.recipients = 0
+
+    def wait(self):
+        with self.lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def should_fail(self) -> bool:
+        with self.lock:
+            return self.random.random() < self.failure_rate
+
+    def count(self, personalizations: int = 0, failed: bool = False):
+        with self.lock:
+            self.requests += 1
+            self.failures += failed
+            self.recipients += personalizations
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {"requests": self.requests, "failures": self.failures, "recipients": self.recipients}
+
+    def start(self) -> "FakeSendGridServer":
+        self.thread = threading.Thread(target=self.serve_forever, name="fake-sendgrid", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self.thread:
+            self.thread.join()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the SendGrid mail send API")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8025, help="Port to listen on")
+    parser.add_argument("--latency", type=float, default=0, help="Seconds every request waits")
+    parser.add_argument("--jitter", type=float, default=0, help="Max random seconds added to the latency")
+    parser.add_argument("--failure-rate", type=float, default=0, help="Share of the failed requests (0-1)")
+    parser.add_argument("--failure-status", type=int, default=500, help="Status of the failed requests (500, 429...)")
+    parser.add_argument("--seed", type=int, help="Random seed (for the repeatable failures)")
+    parser.add_argument("--quiet", action="store_true", help="Don't log the requests")
+    args = parser.parse_args(argv)
+
+    server = FakeSendGridServer(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        failure_status=args.failure_status,
+        seed=args.seed,
+        verbose=not args.quiet,
+    )
+    print(f"Fake SendGrid API at {server.url} (Ctrl+C to stop)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print("Requests: {requests}, failures: {failures}, recipients: {recipients}".format(**server.get_stats()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,20 @@
-import zipfile
-from io import BytesIO
+import logging
+from itertools import chain
+from typing import Iterator
 
 from django.contrib import admin, messages
 from django.contrib.admin import SimpleListFilter
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.db.models import Q
-from django.http import HttpResponse
-
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from .core.helpers.badges import create_badges_pdf, create_checkin_sheet_pdf, get_badges_params
+from .core.helpers.batch_documents import DocumentsBatch, create_combined_documents_pdf
+from .core.helpers.create_pdf import output_pdf
+from .core.helpers.documents import write_export
+from .core.helpers.file_serving import get_file_response, serve_by_web_server
+from .core.helpers.zip_stream import iter_zip
 from .forms import (
     EventAdminForm,
     PaymentAdminForm,
@@ -14,15 +22,28 @@ from .forms import (
     UserAdminForm,
 )
 from .models import (
+    EmailSuppression,
     Event,
     Membership,
     Message,
+    OutboxEmail,
     Payment,
     Registration,
     RegistrationOption,
+    StripeEvent,
     User,
 )
 
+LOG = logging.getLogger(__name__)
+
+
+def get_pdf_attachment_response(content: bytes, filename: str) -> HttpResponse:
+    if serve_by_web_server():
+        return get_file_response(write_export(filename, [content]), filename, "application/pdf")
+    response = HttpResponse(content, content_type="application/pdf")
+    response["Content-Disposition"] = f"attachment; filename={filename}"
+    return response
+
 
 class IsRegularUserFilter(SimpleListFilter):
     """
@@ -102,22 +123,116 @@ admin.site.register(User, UserAdmin)
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
     date_hierarchy = "created_at"
-    readonly_fields = ["emailed"]
+    readonly_fields = ["emailed", "delivery_progress"]
     list_filter = ["event"]
     actions = ["email_registered_users"]
 
+    @admin.display(description="Delivered")
+    def delivery_progress(self, obj):
+        total = obj.deliveries.count()
+        if not total:
+            return "--"
+        return f"{obj.deliveries.filter(sent_at__isnull=False).count()} of {total}"
+
     @admin.action(description="Email message(s) to registered users or members")
     def email_registered_users(self, request, queryset):
+        # Only queued here: the `send_message` worker sends them, the request doesn't wait for the SendGrid calls
         count = 0
         for obj in queryset:
-            count += obj.send_email()
+            count += obj.enqueue()
         self.message_user(
             request,
-            f"Sent {queryset.count()} messages to {count} users",
+            f"Queued {queryset.count()} messages to {count} users, they're sent by the send_message worker",
             messages.SUCCESS,
         )
 
 
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    date_hierarchy = "created_at"
+    list_display = [
+        "recipient",
+        "subject",
+        "status",
+        "attempts",
+        "created_at",
+        "sent_at",
+    ]
+    list_filter = ["status"]
+    search_fields = ["recipient", "subject"]
+    exclude = ["attachment_content"]
+    readonly_fields = [
+        "recipient",
+        "subject",
+        "message",
+        "is_html",
+        "from_email",
+        "attachment_name",
+        "status",
+        "attempts",
+        "next_attempt_at",
+        "last_error",
+        "created_at",
+        "sent_at",
+    ]
+    actions = ["retry_emails"]
+
+    @admin.action(description="Retry sending the failed or pending emails now")
+    def retry_emails(self, request, queryset):
+        count = queryset.exclude(status="SENT").update(status="PENDING", attempts=0, next_attempt_at=timezone.now())
+        self.message_user(request, f"{count} email(s) queued", messages.SUCCESS)
+
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    date_hierarchy = "created_at"
+    list_display = [
+        "event_id",
+        "type",
+        "status",
+        "attempts",
+        "created_at",
+        "processed_at",
+    ]
+    list_filter = ["status", "type"]
+    search_fields = ["event_id"]
+    readonly_fields = [
+        "event_id",
+        "type",
+        "data",
+        "status",
+        "attempts",
+        "next_attempt_at",
+        "last_error",
+        "created_at",
+        "processed_at",
+    ]
+    actions = ["retry_events"]
+
+    @admin.action(description="Retry processing the failed or pending events now")
+    def retry_events(self, request, queryset):
+        count = queryset.exclude(status="PROCESSED").update(
+            status="PENDING", attempts=0, next_attempt_at=timezone.now()
+        )
+        self.message_user(request, f"{count} event(s) queued", messages.SUCCESS)
+
+
+@admin.register(EmailSuppression)
+class EmailSuppressionAdmin(admin.ModelAdmin):
+    list_display = [
+        "email",
+        "reason",
+        "details",
+        "updated_at",
+    ]
+    list_filter = ["reason"]
+    search_fields = ["email"]
+    readonly_fields = [
+        "created_at",
+        "updated_at",
+    ]
+
+
 @admin.register(Membership)
 class MembershipAdmin(admin.ModelAdmin):
     list_display = [
@@ -133,11 +248,13 @@ class MembershipAdmin(admin.ModelAdmin):
 @admin.register(Registration)
 class RegistrationAdmin(admin.ModelAdmin):
     readonly_fields = [
+        "checkin_code",
         "created_at",
         "updated_at",
     ]
     search_fields = [
         "event",
+        "checkin_code",
     ]
     list_display = [
         "user_column",
@@ -204,6 +321,7 @@ class EventAdmin(admin.ModelAdmin):
     readonly_fields = [
         "registration_open",
         "edit_registration_url",
+        "checkin_url",
     ]
     search_fields = [
         "title",
@@ -219,6 +337,58 @@ class EventAdmin(admin.ModelAdmin):
         "public",
         "edit_registration_url",
     ]
+    actions = [
+        "download_badges",
+        "download_checkin_sheet",
+    ]
+
+    def attendees_pdf(self, request, queryset, create, name):
+        """Send the pdf (badges or check-in sheet) for the registered attendees of the selected event"""
+        if queryset.count() != 1:
+            self.message_user(request, "Select one event", messages.ERROR)
+            return
+        event = queryset.get()
+        registrations = event.registrations.filter(status="REGISTERED").select_related("user", "option")
+        badges = get_badges_params(registrations)
+        if not badges:
+            self.message_user(request, f"No registered attendees for {event.title}", messages.ERROR)
+            return
+        content = output_pdf(create(event.title, badges))
+        self.message_user(request, f"Exported {len(badges)} {name}(s)", messages.SUCCESS)
+        return get_pdf_attachment_response(content, f"dds-{event.code}-{name}s.pdf")
+
+    @admin.action(description="Download badges of the registered attendees")
+    def download_badges(self, request, queryset):
+        return self.attendees_pdf(request, queryset, create_badges_pdf, "badge")
+
+    @admin.action(description="Download check-in sheet of the registered attendees")
+    def download_checkin_sheet(self, request, queryset):
+        return self.attendees_pdf(request, queryset, create_checkin_sheet_pdf, "attendee")
+
+
+def iter_documents_entries(batch: DocumentsBatch, kind: str) -> Iterator[tuple[str, bytes]]:
+    """
+    The `(name, pdf data)` zip entries for the documents batch.
+
+    The first document is taken (or rendered) at once, before the response is started, so a failing render gives an
+    error page instead of a broken download. If a later one fails (the response is already being sent), the error is
+    logged and the archive is finished with a note about the missing documents, instead of being cut off.
+    """
+    documents = iter(batch)
+    first = next(documents, None)
+
+    def get_entries() -> Iterator[tuple[str, bytes]]:
+        count = 0
+        try:
+            for payment, content in chain([first] if first is not None else [], documents):
+                yield f"DdS {kind} {payment.invoice_no}.pdf", content
+                count += 1
+        except Exception:
+            LOG.exception(f"The {kind}s zip export failed after {count} of {len(batch)} document(s)")
+            note = f"Only {count} of {len(batch)} {kind}(s) were exported: the export failed, see the server log.\n"
+            yield "EXPORT FAILED.txt", note.encode()
+
+    return get_entries()
 
 
 @admin.register(Payment)
@@ -237,7 +407,39 @@ class PaymentAdmin(admin.ModelAdmin):
         "created",
         "updated",
     ]
-    actions = ["mark_invoice_paid", "email_invoices", "email_receipts", "download_invoices", "download_receipts"]
+    actions = [
+        "mark_invoice_paid",
+        "email_invoices",
+        "email_receipts",
+        "download_invoices",
+        "download_receipts",
+        "download_combined_invoices",
+        "download_combined_receipts",
+    ]
+
+    def stream_documents_zip(self, request, queryset, kind):
+        """
+        Send the documents zip entry by entry, as they're taken from the store or rendered (the batch summary goes to
+        the log at the end). If the files are sent by the web server, the zip is written to the exports folder first.
+
+        The documents are rendered in the request process (the rendering pool is for the management commands, see
+        `render_pdfs`), the larger exports are done with the `export_fiscal_year` command.
+        """
+        batch = DocumentsBatch(queryset, kind, workers=1)
+        self.message_user(request, f"Exporting {len(batch)} {kind}(s)", messages.SUCCESS)
+        entries = iter_documents_entries(batch, kind)
+        filename = f"dds-{kind}s.zip"
+        if serve_by_web_server():
+            return get_file_response(write_export(filename, iter_zip(entries)), filename, "application/octet-stream")
+        response = StreamingHttpResponse(iter_zip(entries), content_type="application/octet-stream")
+        response["Content-Disposition"] = f"attachment; filename={filename}"
+        return response
+
+    def combined_documents_pdf(self, request, queryset, kind):
+        """Send the documents as one multi-page pdf (with the fonts embedded once)"""
+        content = output_pdf(create_combined_documents_pdf(queryset, kind))
+        self.message_user(request, f"Exported {queryset.count()} {kind}(s)", messages.SUCCESS)
+        return get_pdf_attachment_response(content, f"dds-{kind}s.pdf")
 
     @admin.action(description="Mark selected invoices paid")
     def mark_invoice_paid(self, request, queryset):
@@ -283,15 +485,7 @@ class PaymentAdmin(admin.ModelAdmin):
             )
             return
 
-        outfile = BytesIO()
-
-        with zipfile.ZipFile(outfile, "w") as zf:
-            for obj in qs:
-                zf.writestr(f"DdS invoice {obj.invoice_no}.pdf", obj.invoice_pdf().output())
-
-        response = HttpResponse(outfile.getvalue(), content_type="application/octet-stream")
-        response["Content-Disposition"] = "attachment; filename=dds-invoices.zip"
-        return response
+        return self.stream_documents_zip(request, qs, "invoice")
 
     @admin.action(description="Email receipts for completed payments to user")
     def email_receipts(self, request, queryset):
@@ -326,12 +520,32 @@ class PaymentAdmin(admin.ModelAdmin):
             )
             return
 
-        outfile = BytesIO()
+        return self.stream_documents_zip(request, qs, "receipt")
 
-        with zipfile.ZipFile(outfile, "w") as zf:
-            for obj in qs:
-                zf.writestr(f"DdS receipt {obj.invoice_no}.pdf", obj.receipt_pdf().output())
+    @admin.action(description="Download unpaid invoices as one pdf")
+    def download_combined_invoices(self, request, queryset):
+        qs = queryset.filter(status__in=("CREATED", "ISSUED"))
 
-        response = HttpResponse(outfile.getvalue(), content_type="application/octet-stream")
-        response["Content-Disposition"] = "attachment; filename=dds-receipts.zip"
-        return response
+        if not qs.count():
+            self.message_user(
+                request,
+                "No unpaid invoices in queryset",
+                messages.ERROR,
+            )
+            return
+
+        return self.combined_documents_pdf(request, qs, "invoice")
+
+    @admin.action(description="Download completed payment receipts as one pdf")
+    def download_combined_receipts(self, request, queryset):
+        qs = queryset.filter(status="PAID")
+
+        if not qs.count():
+            self.message_user(
+                request,
+                "No completed payments in queryset",
+                messages.ERROR,
+            )
+            return
+
+        return self.combined_documents_pdf(request, qs, "receipt")
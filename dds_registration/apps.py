@@ -10,7 +10,10 @@ class RegConfig(AppConfig):
         from django.conf import settings
         from djf_surveys.app_settings import SURVEY_FIELD_VALIDATORS
 
+        from .core.helpers.http import OutboundStripeClient, get_outbound_service
+
         stripe.api_key = settings.STRIPE_SECRET_KEY
+        stripe.default_http_client = OutboundStripeClient(get_outbound_service("stripe"))
 
         SURVEY_FIELD_VALIDATORS["min_length"]["text_area"] = 3
         SURVEY_FIELD_VALIDATORS["max_length"] = {
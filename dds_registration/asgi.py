@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "dds_registration.settings")
 
 application = get_asgi_application()
+
+# Parse the pdf fonts and images once, before the workers start serving requests (or fork)
+from dds_registration.core.helpers.create_pdf import preload_pdf_resources  # noqa: E402
+
+preload_pdf_resources()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# @module badges
+# @desc Printable attendee badges and check-in sheets for the events
+
+from typing import Iterable
+
+from django.db.models import Model
+from fpdf import FPDF, Align
+
+from .create_pdf import DDS_LOGO, create_document, normalize_text
+from .pdf_resources import FONT_FAMILY, put_cached_svg_image
+
+__all__ = [
+    "get_badges_params",
+    "create_badges_pdf",
+    "create_checkin_sheet_pdf",
+]
+
+# Badges layout (mm): a grid of credit card sized badges on A4 pages, with the cut lines
+badges_margin = 10
+badge_width = 85
+badge_height = 54
+badge_padding = 5
+badge_columns = 2
+badge_rows = 5
+badge_gap = (210 - 2 * badges_margin - badge_columns * badge_width) / (badge_columns - 1)
+badge_logo_width = 28
+badges_per_page = badge_columns * badge_rows
+
+checkin_sheet_layout = (8, 44, 26, 12, 10)
+
+
+def get_badges_params(registrations: Iterable[Model]) -> list[dict]:
+    """
+    Prepare the badge fields of the registrations (with the users and the options selected in advance, to avoid the
+    query per registration), sorted by the attendee name.
+    """
+    params = [
+        dict(
+            name=registration.user.get_full_name() or registration.user.email,
+            option=registration.option.item if registration.option else "",
+            checkin_code=registration.checkin_code,
+        )
+        for registration in registrations
+    ]
+    return sorted(params, key=lambda badge: badge["name"].lower())
+
+
+def get_badge_position(index: int) -> tuple[float, float]:
+    column, row = index % badge_columns, index // badge_columns % badge_rows
+    return badges_margin + column * (badge_width + badge_gap), badges_margin + row * badge_height
+
+
+def draw_badge(pdf: FPDF, x: float, y: float, event_title: str, name: str, option: str, checkin_code: str) -> None:
+    inner_width = badge_width - 2 * badge_padding
+    pdf.set_draw_color(200)
+    pdf.rect(x, y, badge_width, badge_height)
+
+    # The logo is placed at the same few positions on every page, so its paths are parsed once per position
+    put_cached_svg_image(pdf, DDS_LOGO, x=x + badge_padding, y=y + badge_padding, w=badge_logo_width)
+
+    pdf.set_font(FONT_FAMILY, size=7)
+    title_x = x + badge_padding + badge_logo_width + badge_padding
+    pdf.set_xy(title_x, y + badge_padding)
+    pdf.multi_cell(
+        text=normalize_text(event_title),
+        w=x + badge_width - badge_padding - title_x,
+        h=pdf.font_size * 1.3,
+        align=Align.R,
+    )
+
+    pdf.set_font(FONT_FAMILY, style="B", size=16)
+    pdf.set_xy(x + badge_padding, y + 21)
+    pdf.multi_cell(text=normalize_text(name), w=inner_width, h=pdf.font_size * 1.2, align=Align.C)
+
+    pdf.set_font(FONT_FAMILY, size=9)
+    if option:
+        pdf.set_xy(x + badge_padding, y + badge_height - badge_padding - 10)
+        pdf.cell(text=normalize_text(option), w=inner_width, h=5, align=Align.C)
+    pdf.set_font(FONT_FAMILY, style="B", size=9)
+    pdf.set_xy(x + badge_padding, y + badge_height - badge_padding - 5)
+    pdf.cell(text=checkin_code, w=inner_width, h=5, align=Align.R)
+
+
+def create_badges_pdf(event_title: str, badges: list[dict]) -> FPDF:
+    """
+    Put the badges (see `get_badges_params`) of the event attendees into one multi-page pdf, ten badges per page.
+
+    All the badges are drawn in one document (instead of the rendering pool of the payment documents): the fonts are
+    embedded once, and a badge is too small to be worth sending to another process.
+    """
+    pdf = create_document()
+    pdf.set_title(f"{event_title}: badges")
+    pdf.set_auto_page_break(False)
+    for index, badge in enumerate(badges):
+        if index and not index % badges_per_page:
+            pdf.add_page()
+        draw_badge(pdf, *get_badge_position(index), event_title=event_title, **badge)
+    return pdf
+
+
+def create_checkin_sheet_pdf(event_title: str, badges: list[dict]) -> FPDF:
+    """The attendees list (see `get_badges_params`) with the check-in codes and the boxes to tick at the door"""
+    pdf = create_document()
+    pdf.set_title(f"{event_title}: check-in sheet")
+    line_height = pdf.font_size * 1.3
+    pdf.multi_cell(text=normalize_text(f"{event_title}: check-in"), w=pdf.epw, h=line_height, markdown=False)
+    pdf.set_font(FONT_FAMILY, size=10)
+    pdf.multi_cell(text=f"{len(badges)} attendee(s)", w=pdf.epw, h=line_height)
+    pdf.set_y(pdf.get_y() + line_height / 2)
+    pdf.set_draw_color(200)
+    with pdf.table(
+        col_widths=checkin_sheet_layout,
+        text_align="LEFT",
+        line_height=line_height,
+        padding=2,
+        v_align="T",
+        cell_fill_color=240,
+        cell_fill_mode="ROWS",
+    ) as table:
+        table.row(("#", "Name", "Option", "Code", "In"))
+        for number, badge in enumerate(badges, 1):
+            table.row(
+                (str(number), normalize_text(badge["name"]), normalize_text(badge["option"]), badge["checkin_code"], "")
+            )
+    return pdf
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# @module batch_documents
+# @desc Batch rendering of the payment documents, using a pool of worker processes
+
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator
+
+from django.conf import settings
+from django.db.models import Model
+from fpdf import FPDF
+
+from .create_pdf import (
+    create_combined_pdf,
+    get_invoice_pdf_params,
+    get_receipt_pdf_params,
+    preload_pdf_resources,
+    render_pdf,
+)
+from .documents import get_document, write_document
+
+__all__ = [
+    "DocumentsBatch",
+    "create_combined_documents_pdf",
+    "get_documents_params",
+    "render_pdfs",
+]
+
+LOG = logging.getLogger(__name__)
+
+# Starting the worker processes takes seconds (each one imports the app and loads the pdf resources): 8 documents
+# took 0.88s rendered in place and 5.81s with 4 workers, ~110ms per document. The pool pays off only for the larger
+# batches.
+min_pool_batch_size = 64
+
+
+def get_render_workers() -> int:
+    return getattr(settings, "PDF_RENDER_WORKERS", 0) or os.cpu_count() or 1
+
+
+def get_member_names(payments: list[Model]) -> dict[int, str]:
+    """Get the member names for all the membership payments with one query"""
+    from ...models import User
+
+    user_ids = {payment.data["user"]["id"] for payment in payments if payment.data["kind"] == "membership"}
+    if not user_ids:
+        return {}
+    return {user.id: user.get_full_name() for user in User.objects.filter(id__in=user_ids)}
+
+
+def get_documents_params(payments: list[Model], kind: str) -> list[dict]:
+    """Prepare the `create_pdf` parameters for the documents (invoices or receipts) of the payments"""
+    if kind not in ("invoice", "receipt"):
+        raise ValueError(f"Unknown document kind: {kind}")
+    get_params = get_invoice_pdf_params if kind == "invoice" else get_receipt_pdf_params
+    member_names = get_member_names(payments)
+    return [get_params(payment, member_name=member_names.get(payment.data["user"]["id"], "")) for payment in payments]
+
+
+def create_combined_documents_pdf(payments: Iterable[Model], kind: str) -> FPDF:
+    """Put the documents (invoices or receipts) of the payments into one multi-page pdf"""
+    payments = list(payments)
+    return create_combined_pdf(get_documents_params(payments, kind), title="DdS {}s".format(kind))
+
+
+def render_pdfs(params_list: list[dict], workers: int | None = None) -> Iterator[bytes]:
+    """
+    Render the documents (from the `create_pdf` parameters), yielding the pdf data in the same order.
+
+    Large batches are rendered in a pool of worker processes. Only a few documents per worker are queued at a time,
+    so the rendered (and not yet consumed) data doesn't pile up in memory.
+
+    The pool is meant for the management commands (see `export_fiscal_year`): the workers are started from
+    `sys.executable`, which is the web server binary (not python) in a uWSGI or mod_wsgi process, so the web requests
+    render in place (`workers=1`).
+    """
+    if workers is None:
+        workers = get_render_workers()
+    workers = min(workers, len(params_list))
+    if workers <= 1 or len(params_list) < min_pool_batch_size:
+        for params in params_list:
+            yield render_pdf(params)
+        return
+    # NOTE: Don't fork the (possibly multi-threaded) web server process, the rendering doesn't need django at all
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=preload_pdf_resources) as executor:
+        params_iter = iter(params_list)
+        queue = deque(executor.submit(render_pdf, params) for params in islice(params_iter, workers * 2))
+        while queue:
+            content = queue.popleft().result()
+            params = next(params_iter, None)
+            if params is not None:
+                queue.append(executor.submit(render_pdf, params))
+            yield content
+
+
+class DocumentsBatch:
+    """
+    The documents (invoices or receipts) for the selected payments.
+
+    Iterating yields `(payment, pdf data)` pairs in the payments order. The documents are taken from the documents
+    store if they're there, the rest are rendered (see `render_pdfs`) and stored. All the data needed for rendering
+    is loaded in advance, with one query for all the membership payment users (for the member names).
+    """
+
+    def __init__(self, payments: Iterable[Model], kind: str, workers: int | None = None):
+        if kind not in ("invoice", "receipt"):
+            raise ValueError(f"Unknown document kind: {kind}")
+        self.payments = list(payments)
+        self.kind = kind
+        self.workers = workers
+        self.rendered = 0
+        self.stored = 0
+        self.elapsed = 0.0
+
+    def __len__(self) -> int:
+        return len(self.payments)
+
+    def __iter__(self) -> Iterator[tuple[Model, bytes]]:
+        started = time.perf_counter()
+        self.rendered = self.stored = 0
+        paths = [payment.document_path(self.kind) for payment in self.payments]
+        missing = {payment.id for payment, path in zip(self.payments, paths) if not path.exists()}
+        params_list = get_documents_params([payment for payment in self.payments if payment.id in missing], self.kind)
+        rendered = render_pdfs(params_list, self.workers)
+        for payment, path in zip(self.payments, paths):
+            if payment.id in missing:
+                content = next(rendered)
+                write_document(path, content)
+                self.rendered += 1
+            else:
+                content = get_document(path, lambda: payment.render_document(self.kind))
+                self.stored += 1
+            yield payment, content
+        self.elapsed = time.perf_counter() - started
+        LOG.info(self.summary)
+
+    @property
+    def throughput(self) -> float:
+        return len(self) / self.elapsed if self.elapsed else 0
+
+    @property
+    def summary(self) -> str:
+        return "{} {}(s) in {:.1f}s ({:.1f}/s; {} rendered, {} from the store)".format(
+            len(self), self.kind, self.elapsed, self.throughput, self.rendered, self.stored
+        )
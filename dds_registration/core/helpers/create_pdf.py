@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from datetime import date, timedelta
 from pathlib import Path
+from typing import Iterable
 
 from django.db.models import Model
 from fpdf import FPDF, Align
@@ -10,10 +11,24 @@ from ..constants.payments import (
     payment_recipient_address,
     payment_recipient_name,
 )
+from .pdf_resources import (
+    FONT_FAMILY,
+    add_cached_fonts,
+    drop_unused_fonts,
+    preload_fonts,
+    preload_svg_image,
+    put_cached_svg_image,
+)
 
 __all__ = [
     "create_invoice_pdf_from_payment",
     "create_receipt_pdf_from_payment",
+    "create_combined_pdf",
+    "get_invoice_pdf_params",
+    "get_receipt_pdf_params",
+    "render_pdf",
+    "output_pdf",
+    "preload_pdf_resources",
 ]
 
 BASE_DIR = Path(__file__).resolve().parent
@@ -29,12 +44,55 @@ right_column_width = 55  # Width of the right top column
 logo_width = 60  # Set logo width
 top_offset = 30  # Top offset should exceed the logo height
 font_size = 12
+compress_streams = True  # Deflate the page contents and the embedded fonts (turn off only to inspect the pdf source)
+
+
+def preload_pdf_resources() -> None:
+    """Parse the fonts and the logo in advance, to be called at the worker start"""
+    preload_fonts()
+    preload_svg_image(DDS_LOGO, x=right_column_pos + 1, y=margin_size, w=logo_width)
 
 
 def normalize_text(text: str) -> str:
     return text.encode("utf-8", "ignore").decode("utf-8").strip()
 
 
+def create_document() -> FPDF:
+    """Create an empty document, with the fonts, margins and the first page"""
+    pdf = FPDF(unit="mm", format="A4")
+    pdf.set_compression(compress_streams)
+
+    # Fonts are parsed once per process (see `pdf_resources`)
+    add_cached_fonts(pdf)
+
+    pdf.set_margins(left=margin_size, top=margin_size, right=margin_size)
+    pdf.add_page()
+    pdf.set_font(FONT_FAMILY, size=font_size)
+    return pdf
+
+
+def draw_letterhead(pdf: FPDF, logo_svg_path: Path, recipient_name: str, recipient_address: str) -> float:
+    """Put the static part of the page (the logo and the recipient column), return the bottom of the column"""
+    line_height = pdf.font_size * 1.3
+    small_vertical_space = line_height / 4
+
+    # Put logo
+    put_cached_svg_image(pdf, logo_svg_path, x=right_column_pos + 1, y=margin_size, w=logo_width)
+    # @see https://py-pdf.github.io/fpdf2/fpdf/fpdf.html#fpdf.fpdf.FPDF.image
+    # @see https://py-pdf.github.io/fpdf2/SVG.html
+
+    # Right (recipient) address column...
+    pdf.set_xy(right_column_pos, margin_size + top_offset)
+    pdf.multi_cell(text=recipient_name, w=right_column_width, align=Align.L, new_x="LEFT", new_y="NEXT", h=line_height)
+
+    pdf.set_xy(right_column_pos, pdf.get_y() + small_vertical_space)
+    pdf.multi_cell(
+        text=recipient_address.strip(), w=right_column_width, align=Align.L, new_x="LEFT", new_y="NEXT", h=line_height
+    )
+
+    return pdf.get_y()
+
+
 def create_pdf(
     kind: str,
     client_name: str,
@@ -50,28 +108,24 @@ def create_pdf(
     payment_days: int = default_payment_deadline_days,
     logo_svg_path: Path = DDS_LOGO,
     paid_date: str | None = None,
+    pdf: FPDF | None = None,
 ) -> FPDF:
+    """Create the invoice or receipt document, or add it (on a new page) to the given `pdf` document"""
 
     if invoice_date is None:
         invoice_date = date.today()
 
-    # Create pdf...
-    pdf = FPDF(unit="mm", format="A4")
-
-    pdf.add_font("NotoSans", style="", fname=BASE_DIR / "fonts" / "NotoSans-Regular.ttf", uni=True)
-    pdf.add_font("NotoSans", style="B", fname=BASE_DIR / "fonts" / "NotoSans-Bold.ttf", uni=True)
-    pdf.add_font("NotoSans", style="I", fname=BASE_DIR / "fonts" / "NotoSans-Italic.ttf", uni=True)
-    pdf.add_font("NotoSans", style="BI", fname=BASE_DIR / "fonts" / "NotoSans-BoldItalic.ttf", uni=True)
-
-    pdf.set_title("{} {} ({})".format(kind.title(), invoice_number, client_name))
-    pdf.set_margins(left=margin_size, top=margin_size, right=margin_size)
+    if pdf is None:
+        # Create pdf...
+        pdf = create_document()
+        pdf.set_title("{} {} ({})".format(kind.title(), invoice_number, client_name))
+    else:
+        pdf.add_page()
+        pdf.set_font(FONT_FAMILY, size=font_size)
 
     # Get full page width (mm)...
     page_width = pdf.epw
 
-    pdf.add_page()
-    pdf.set_font("NotoSans", size=font_size)
-
     # Get derived dimensions...
     pdf_font_size = pdf.font_size
     line_height = pdf_font_size * 1.3
@@ -80,10 +134,8 @@ def create_pdf(
     small_vertical_space = vertical_space / 2
     tiny_vertical_space = vertical_space / 4
 
-    # Put logo
-    pdf.image(logo_svg_path, x=right_column_pos + 1, y=margin_size, w=logo_width, keep_aspect_ratio=True)
-    # @see https://py-pdf.github.io/fpdf2/fpdf/fpdf.html#fpdf.fpdf.FPDF.image
-    # @see https://py-pdf.github.io/fpdf2/SVG.html
+    # Put the logo and the recipient column...
+    right_stop_pos = draw_letterhead(pdf, logo_svg_path, recipient_name, recipient_address)
 
     # Left (client) address column...
     pdf.set_xy(left_column_pos, margin_size + top_offset)
@@ -103,17 +155,6 @@ def create_pdf(
 
     left_stop_pos = pdf.get_y()
 
-    # Right (client) address column...
-    pdf.set_xy(right_column_pos, margin_size + top_offset)
-    pdf.multi_cell(text=recipient_name, w=right_column_width, align=Align.L, new_x="LEFT", new_y="NEXT", h=line_height)
-
-    pdf.set_xy(right_column_pos, pdf.get_y() + small_vertical_space)
-    pdf.multi_cell(
-        text=recipient_address.strip(), w=right_column_width, align=Align.L, new_x="LEFT", new_y="NEXT", h=line_height
-    )
-
-    right_stop_pos = pdf.get_y()
-
     # Choose the most bottom position of two top columns...
     max_right_top = max(left_stop_pos, right_stop_pos)
 
@@ -222,9 +263,38 @@ def create_pdf(
     return pdf
 
 
-def create_invoice_pdf_from_payment(payment: Model) -> FPDF:
-    from ...models import User
+def create_combined_pdf(params_list: Iterable[dict], title: str) -> FPDF:
+    """
+    Put the documents (from the `create_pdf` parameters) into one multi-page pdf: the fonts are embedded only once,
+    instead of once per document.
+    """
+    pdf = None
+    for params in params_list:
+        pdf = create_pdf(**params, pdf=pdf)
+    if pdf is None:
+        raise ValueError("No documents to combine")
+    pdf.set_title(title)
+    return pdf
+
+
+def output_pdf(pdf: FPDF) -> bytes:
+    """Get the pdf data, with only the font styles the document uses (and only their used glyphs) embedded"""
+    drop_unused_fonts(pdf)
+    return bytes(pdf.output())
+
 
+def render_pdf(params: dict) -> bytes:
+    """Render the document from the `create_pdf` parameters (as prepared by `get_*_pdf_params`) to the pdf data"""
+    return output_pdf(create_pdf(**params))
+
+
+def get_payment_items(payment: Model, member_name: str | None = None) -> tuple[list, tuple]:
+    """
+    Return the table items and the column layout for the payment document.
+
+    The member name (for membership payments) can be passed if it's already known, otherwise it's fetched from the
+    user account.
+    """
     if payment.data["kind"] == "event":
         items = [
             ("Quantity", "Event", "Registration", f"Price ({payment.data['currency']})"),
@@ -233,11 +303,14 @@ def create_invoice_pdf_from_payment(payment: Model) -> FPDF:
         ]
         column_layout = (15, 45, 20, 20)
     else:
-        user = User.objects.get(id=payment.data["user"]["id"])
+        if member_name is None:
+            from ...models import User
+
+            member_name = User.objects.get(id=payment.data["user"]["id"]).get_full_name()
         items = [
             ("Member name", "Membership", "Valid until", f"Price ({payment.data['currency']})"),
             (
-                user.get_full_name(),
+                member_name,
                 payment.data["membership"]["label"],
                 str(payment.data["until"]) + "-12-31",
                 payment.data["price"],
@@ -245,8 +318,12 @@ def create_invoice_pdf_from_payment(payment: Model) -> FPDF:
             ("", "", "**Total**", payment.data["price"]),
         ]
         column_layout = (40, 20, 20, 20)
+    return items, column_layout
+
 
-    return create_pdf(
+def get_invoice_pdf_params(payment: Model, member_name: str | None = None) -> dict:
+    items, column_layout = get_payment_items(payment, member_name)
+    return dict(
         kind="invoice",
         client_name=payment.data["user"]["name"],
         client_address=payment.data["user"]["address"],
@@ -259,31 +336,9 @@ def create_invoice_pdf_from_payment(payment: Model) -> FPDF:
     )
 
 
-def create_receipt_pdf_from_payment(payment: Model) -> FPDF:
-    from ...models import User
-
-    if payment.data["kind"] == "event":
-        items = [
-            ("Quantity", "Event", "Registration", f"Price ({payment.data['currency']})"),
-            (1, payment.data["event"]["title"], payment.data["option"]["item"], payment.data["price"]),
-            ("", "**Total**", "", payment.data["price"]),
-        ]
-        column_layout = (15, 45, 20, 20)
-    else:
-        user = User.objects.get(id=payment.data["user"]["id"])
-        items = [
-            ("Member name", "Membership", "Valid until", f"Price ({payment.data['currency']})"),
-            (
-                user.get_full_name(),
-                payment.data["membership"]["label"],
-                str(payment.data["until"]) + "-12-31",
-                payment.data["price"],
-            ),
-            ("", "", "**Total**", payment.data["price"]),
-        ]
-        column_layout = (40, 20, 20, 20)
-
-    return create_pdf(
+def get_receipt_pdf_params(payment: Model, member_name: str | None = None) -> dict:
+    items, column_layout = get_payment_items(payment, member_name)
+    return dict(
         kind="receipt",
         client_name=payment.data["user"]["name"],
         client_address=payment.data["user"]["address"],
@@ -294,3 +349,11 @@ def create_receipt_pdf_from_payment(payment: Model) -> FPDF:
         extra=payment.data["extra"],
         paid_date=payment.data["paid_date"],
     )
+
+
+def create_invoice_pdf_from_payment(payment: Model, member_name: str | None = None) -> FPDF:
+    return create_pdf(**get_invoice_pdf_params(payment, member_name))
+
+
+def create_receipt_pdf_from_payment(payment: Model, member_name: str | None = None) -> FPDF:
+    return create_pdf(**get_receipt_pdf_params(payment, member_name))
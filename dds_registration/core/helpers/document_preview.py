@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# @module document_preview
+# @desc Lightweight html previews of the payment documents (invoices and receipts)
+
+from datetime import date, timedelta
+from typing import Callable
+
+from django.core.cache import cache
+from django.db.models import Model
+from django.template.loader import render_to_string
+
+from ..constants.payments import default_payment_deadline_days
+from .create_pdf import get_invoice_pdf_params, get_receipt_pdf_params
+
+__all__ = [
+    "get_document_preview_context",
+    "render_document_preview",
+    "get_document_preview",
+]
+
+preview_template = "assets/document-preview/document-preview.django"
+
+# The previews are keyed by the document version, so the stale ones are never read: they only expire
+preview_cache_timeout = 7 * 24 * 60 * 60
+
+
+def get_preview_cell(value) -> dict:
+    """Table cell for the template: the markdown bold (`**Total**`, as in the pdf table) is passed as a flag"""
+    text = str(value)
+    bold = len(text) > 4 and text.startswith("**") and text.endswith("**")
+    return {"text": text[2:-2] if bold else text, "bold": bold}
+
+
+def get_document_preview_context(payment: Model, kind: str, member_name: str | None = None) -> dict:
+    """
+    Template context for the document preview, built from the same `create_pdf` parameters (and the same item rows)
+    as the pdf document.
+    """
+    if kind == "invoice":
+        params = get_invoice_pdf_params(payment, member_name)
+    elif kind == "receipt":
+        params = get_receipt_pdf_params(payment, member_name)
+    else:
+        raise ValueError(f"Unknown document kind: {kind}")
+    document_date = params.get("invoice_date") or date.today()
+    payment_days = params.get("payment_days", default_payment_deadline_days)
+    header, *rows = [[get_preview_cell(value) for value in row] for row in params["items"]]
+    return {
+        "kind": kind,
+        "title": f"{kind.title()} #{params['invoice_number']}",
+        "client_name": params["client_name"],
+        "client_address": params["client_address"].strip(),
+        "header": header,
+        "rows": rows,
+        "document_date": document_date.strftime("%Y-%m-%d"),
+        "due_date": (document_date + timedelta(days=payment_days)).strftime("%Y-%m-%d") if payment_days else None,
+        "payment_days": payment_days,
+        "paid_date": params.get("paid_date"),
+        "recipient_account": (params.get("recipient_account") or "").strip(),
+        "extra": params["extra"],
+    }
+
+
+def render_document_preview(payment: Model, kind: str, member_name: str | None = None) -> str:
+    return render_to_string(preview_template, get_document_preview_context(payment, kind, member_name))
+
+
+def get_document_preview(key: str, render: Callable[[], str]) -> str:
+    """
+    Get the document preview from the cache, or render and cache it. The key has to contain the document version
+    (see `Payment.document_version`).
+    """
+    preview = cache.get(key)
+    if preview is None:
+        preview = render()
+        cache.set(key, preview, preview_cache_timeout)
+    return preview
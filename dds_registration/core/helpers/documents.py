@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+# @module documents
+# @desc Store of the rendered payment documents (invoices and receipts)
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Iterable
+
+from django.conf import settings
+from django.core import signing
+
+__all__ = [
+    "get_document_version",
+    "get_document_path",
+    "write_file",
+    "write_document",
+    "get_document",
+    "ensure_document",
+    "delete_payment_documents",
+    "write_export",
+    "sign_document_link",
+    "check_document_link",
+]
+
+# Exports older than that (seconds) are removed when a new one is written
+exports_max_age = 60 * 60
+
+document_link_salt = "dds_registration.documents.link"
+
+
+def get_document_version(values: dict) -> str:
+    """
+    Short hash of all the values a document is rendered from: any change gives another document version (and file).
+    """
+    data = json.dumps(values, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:16]
+
+
+def get_payment_documents_folder(payment_id: int) -> Path:
+    return Path(settings.DOCUMENTS_ROOT) / "payments" / str(payment_id)
+
+
+def get_document_path(payment_id: int, kind: str, version: str) -> Path:
+    return get_payment_documents_folder(payment_id) / f"{kind}-{version}.pdf"
+
+
+def write_file(path: Path, content: bytes) -> None:
+    """
+    Atomically write the file: readers get either the old or the new content, never a partial one.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+def write_document(path: Path, content: bytes) -> None:
+    """
+    Atomically write the document and remove the outdated versions of the same kind.
+    """
+    write_file(path, content)
+    kind = path.name.split("-", 1)[0]
+    for outdated in path.parent.glob(f"{kind}-*.pdf"):
+        if outdated != path:
+            outdated.unlink(missing_ok=True)
+
+
+def get_document(path: Path, render: Callable[[], bytes]) -> bytes:
+    """
+    Return the stored document, render and store it if it's not there yet.
+    """
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        content = render()
+        write_document(path, content)
+        return content
+
+
+def ensure_document(path: Path, render: Callable[[], bytes]) -> None:
+    if not path.exists():
+        write_document(path, render())
+
+
+def delete_payment_documents(payment_id: int) -> None:
+    shutil.rmtree(get_payment_documents_folder(payment_id), ignore_errors=True)
+
+
+def get_exports_folder() -> Path:
+    return Path(settings.DOCUMENTS_ROOT) / "exports"
+
+
+def cleanup_exports(max_age: float = exports_max_age) -> None:
+    deadline = time.time() - max_age
+    for path in get_exports_folder().glob("*"):
+        try:
+            if path.stat().st_mtime < deadline:
+                path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def write_export(name: str, chunks: Iterable[bytes]) -> Path:
+    """
+    Write the (possibly large) export file chunk by chunk, to be sent by the web server, see `get_file_response`.
+    The file gets a unique name, and it's removed by one of the next exports later on.
+    """
+    cleanup_exports()
+    folder = get_exports_folder()
+    path = folder / f"{uuid.uuid4().hex}-{name}"
+    folder.mkdir(parents=True, exist_ok=True)
+    with path.open("wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+    return path
+
+
+def sign_document_link(payment_id: int, kind: str) -> str:
+    """The token of the document download link: the signed payment id and document kind, with the signing time"""
+    return signing.TimestampSigner(salt=document_link_salt).sign(f"{payment_id}-{kind}").split(":", 1)[1]
+
+
+def check_document_link(payment_id: int, kind: str, token: str) -> bool:
+    """Check the link token signature and age (`DOCUMENT_LINK_MAX_AGE`), without any database lookup"""
+    signer = signing.TimestampSigner(salt=document_link_salt)
+    try:
+        signer.unsign(f"{payment_id}-{kind}:{token}", max_age=settings.DOCUMENT_LINK_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
@@ -1,8 +1,13 @@
 import base64
+import functools
+import logging
+import time
+from typing import Iterable
 
 from django.conf import settings
+from django.utils.module_loading import import_string
 from fpdf import FPDF
-from sendgrid import SendGridAPIClient
+from sendgrid.helpers.eventwebhook import EventWebhook
 from sendgrid.helpers.mail import (
     Attachment,
     Disposition,
@@ -12,6 +17,77 @@ from sendgrid.helpers.mail import (
     Mail,
 )
 
+from .http import get_outbound_service
+
+LOG = logging.getLogger(__name__)
+
+# SendGrid accepts up to 1000 personalizations (separate recipients) per request
+max_personalizations = 1000
+
+
+class SendGridTransport:
+    """
+    Sends the emails with the SendGrid mail send API (or a compatible server at `SENDGRID_API_HOST`), through the
+    shared "sendgrid" outbound client (see `core/helpers/http.py`). A failed request raises `requests.RequestException`.
+    """
+
+    def __init__(self):
+        self.service = get_outbound_service("sendgrid")
+        self.url = f"{settings.SENDGRID_API_HOST.rstrip('/')}/v3/mail/send"
+        self.headers = {"Authorization": f"Bearer {settings.SENDGRID_API_KEY}"}
+
+    def send(self, mail: Mail) -> None:
+        self.service.post(self.url, json=mail.get(), headers=self.headers).raise_for_status()
+
+
+class MemoryTransport:
+    """Keeps the emails (as the SendGrid request data) in the `outbox` list instead of sending them"""
+
+    def __init__(self):
+        self.outbox: list[dict] = []
+
+    def send(self, mail: Mail) -> None:
+        self.outbox.append(mail.get())
+
+
+@functools.cache
+def get_email_transport():
+    """The `EMAIL_TRANSPORT` class instance (an object with the `send(mail)` method), shared by the process"""
+    return import_string(settings.EMAIL_TRANSPORT)()
+
+
+@functools.cache
+def get_event_webhook(public_key: str) -> EventWebhook:
+    return EventWebhook(public_key)
+
+
+def verify_event_webhook(payload: bytes, signature: str, timestamp: str) -> bool:
+    """
+    Check the SendGrid signed event webhook request: the signature of the timestamp and the payload (made with the
+    `SENDGRID_WEBHOOK_PUBLIC_KEY` pair key), and the timestamp age.
+    """
+    if not settings.SENDGRID_WEBHOOK_PUBLIC_KEY or not signature or not timestamp:
+        return False
+    try:
+        if abs(time.time() - int(timestamp)) > settings.SENDGRID_WEBHOOK_MAX_AGE:
+            return False
+        webhook = get_event_webhook(settings.SENDGRID_WEBHOOK_PUBLIC_KEY)
+        return webhook.verify_signature(payload.decode("utf-8"), signature, timestamp)
+    except ValueError:
+        # Malformed timestamp, signature or payload encoding
+        return False
+
+
+def get_suppressed(addresses: Iterable[str]) -> set[str]:
+    """The (lower case) addresses of the list found in the suppression list, with one query"""
+    from ...models import EmailSuppression
+
+    return EmailSuppression.get_suppressed(addresses)
+
+
+def normalize_address(address: str) -> str:
+    return address.strip().lower()
+
 
 def send_email(
     recipient_address: str,
@@ -19,27 +95,62 @@ def send_email(
     message: str,
     is_html: bool = False,
     from_email: str = settings.DEFAULT_FROM_EMAIL,
-    pdf: FPDF | None = None,
+    pdf: FPDF | bytes | None = None,
     pdf_name: str | None = None,
-) -> None:
-    sg = SendGridAPIClient(api_key=settings.SENDGRID_API_KEY)
-    message = Mail(
+) -> bool:
+    """Send the email, unless the recipient is in the suppression list. Return False if it's skipped"""
+    if get_suppressed([recipient_address]):
+        LOG.info("Email '%s' to suppressed %s skipped", subject, recipient_address)
+        return False
+    mail = Mail(
         from_email=from_email,
         to_emails=recipient_address,
         subject=subject,
-        plain_text_content=message,
     )
     if is_html:
-        message.html_content = message
+        mail.html_content = message
     else:
-        message.plain_text_content = message
+        mail.plain_text_content = message
     if pdf:
         if not pdf_name:
             raise ValueError("Must specify `pdf_name`")
+        content = pdf if isinstance(pdf, bytes) else pdf.output()
         attachment = Attachment()
-        attachment.file_content = FileContent(base64.b64encode(pdf.output()).decode())
+        attachment.file_content = FileContent(base64.b64encode(content).decode())
         attachment.file_type = FileType("application/pdf")
         attachment.file_name = FileName(pdf_name)
         attachment.disposition = Disposition("attachment")
-        message.attachment = attachment
-    sg.send(message)
+        mail.attachment = attachment
+    get_email_transport().send(mail)
+    return True
+
+
+def send_broadcast(
+    recipient_addresses: Iterable[str],
+    subject: str,
+    message: str,
+    from_email: str = settings.DEFAULT_FROM_EMAIL,
+) -> int:
+    """
+    Send the same email to many recipients, up to `max_personalizations` recipients per SendGrid request. Every
+    recipient gets a separate personalization, so they don't see each other. The suppressed addresses are skipped.
+    Return the number of the recipients the email is sent to.
+    """
+    addresses = list(dict.fromkeys(normalize_address(address) for address in recipient_addresses if address))
+    suppressed = get_suppressed(addresses)
+    if suppressed:
+        addresses = [address for address in addresses if address not in suppressed]
+    transport = get_email_transport()
+    requests_count = 0
+    for start in range(0, len(addresses), max_personalizations):
+        mail = Mail(
+            from_email=from_email,
+            to_emails=addresses[start : start + max_personalizations],
+            subject=subject,
+            plain_text_content=message,
+            is_multiple=True,
+        )
+        transport.send(mail)
+        requests_count += 1
+    LOG.info("Broadcast '%s' sent to %d recipient(s) in %d request(s)", subject, len(addresses), requests_count)
+    return len(addresses)
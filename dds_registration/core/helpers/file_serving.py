@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# @module file_serving
+# @desc Sending the stored files (documents and exports) by django or by the web server
+
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+
+__all__ = [
+    "serve_by_web_server",
+    "get_file_response",
+]
+
+# The `DOCUMENTS_SERVE_MODE` values
+SERVE_MODES = ("", "x-accel-redirect", "x-sendfile")
+
+
+def serve_by_web_server() -> bool:
+    return bool(settings.DOCUMENTS_SERVE_MODE)
+
+
+def get_file_response(path: Path, filename: str, content_type: str) -> HttpResponse:
+    """
+    Send the file from the documents store as an attachment.
+
+    The access must be checked by the caller. Then, depending on `DOCUMENTS_SERVE_MODE`, the file is sent by nginx
+    (`X-Accel-Redirect` to the internal `DOCUMENTS_ACCEL_LOCATION`), by apache or lighttpd (`X-Sendfile`), or by
+    django itself.
+    """
+    mode = settings.DOCUMENTS_SERVE_MODE
+    if mode not in SERVE_MODES:
+        raise ValueError(f"Unknown documents serve mode: {mode}")
+    path = Path(path).resolve()
+    if mode == "x-accel-redirect":
+        relative_path = path.relative_to(Path(settings.DOCUMENTS_ROOT).resolve())
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = settings.DOCUMENTS_ACCEL_LOCATION + quote(relative_path.as_posix())
+    elif mode == "x-sendfile":
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = str(path)
+    else:
+        response = FileResponse(path.open("rb"), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+# @module http
+# @desc Shared outbound HTTP clients for the third party services (Stripe, SendGrid, Slack)
+
+import functools
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import requests
+import stripe
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+__all__ = [
+    "OutboundBusy",
+    "OutboundService",
+    "OutboundStripeClient",
+    "get_outbound_service",
+    "get_outbound_stats",
+]
+
+LOG = logging.getLogger(__name__)
+
+# Defaults of the `OUTBOUND_HTTP` service options: (connect, read) timeouts, concurrent calls per process, and seconds
+# to wait for a free call slot
+default_timeout = (3.05, 10)
+default_concurrency = 4
+default_wait = 10
+
+# Durations kept per service for the percentiles
+stats_window = 1000
+
+
+class OutboundBusy(requests.RequestException):
+    """All the call slots of the service are taken for longer than its `wait` time"""
+
+
+class OutboundStats:
+    """Calls count, failures and durations of a service (in the current process)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = self.failures = 0
+        self.total = 0.0
+        self.durations: deque[float] = deque(maxlen=stats_window)
+
+    def add(self, duration: float, failed: bool) -> None:
+        with self.lock:
+            self.calls += 1
+            self.failures += failed
+            self.total += duration
+            self.durations.append(duration)
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            durations = sorted(self.durations)
+            calls, failures, total = self.calls, self.failures, self.total
+        cuts = statistics.quantiles(durations, n=100, method="inclusive") if len(durations) > 1 else durations * 99
+        return {
+            "calls": calls,
+            "failures": failures,
+            "total_s": round(total, 3),
+            "p50_ms": round(cuts[49] * 1000, 1) if cuts else None,
+            "p95_ms": round(cuts[94] * 1000, 1) if cuts else None,
+            "max_ms": round(durations[-1] * 1000, 1) if durations else None,
+        }
+
+
+class OutboundService:
+    """
+    HTTP calls to one third party service: a keep-alive connection pool (sized by the concurrency limit), the default
+    timeouts, the limit of concurrent calls (the threads over it wait for `wait` seconds, then `OutboundBusy` is
+    raised), and the timings of every call.
+
+    `requests.Session` isn't thread-safe (its cookies and settings are changed by the calls), so every thread gets its
+    own session. They all use the same adapter, so the connection pool (a thread-safe urllib3 pool) is still shared.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        timeout: float | tuple[float, float] = default_timeout,
+        concurrency: int = default_concurrency,
+        wait: float = default_wait,
+    ):
+        self.name = name
+        self.timeout = timeout
+        self.wait = wait
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.stats = OutboundStats()
+        # The retries (if any) are up to the callers: the outbox and the stripe library retry by themselves
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency, max_retries=0)
+        self.local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        """The session of the current thread (using the shared adapter)"""
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = requests.Session()
+            session.mount("https://", self.adapter)
+            session.mount("http://", self.adapter)
+        return session
+
+    @contextmanager
+    def measure(self, method: str, url: str):
+        """
+        Take a call slot for the block and time it. The block may set the response status to the yielded dict (the
+        statuses 400 and above are counted as failures).
+        """
+        if not self.slots.acquire(timeout=self.wait):
+            self.stats.add(0, failed=True)
+            raise OutboundBusy(f"No free {self.name} connection in {self.wait}s")
+        outcome = {"status": None}
+        started = time.perf_counter()
+        failed = True
+        try:
+            yield outcome
+            failed = bool(outcome["status"] and outcome["status"] >= 400)
+        finally:
+            self.slots.release()
+            duration = time.perf_counter() - started
+            self.stats.add(duration, failed)
+            LOG.log(
+                logging.WARNING if failed else logging.DEBUG,
+                "%s %s %s: %s in %.3fs",
+                self.name,
+                method,
+                url,
+                outcome["status"] or "error",
+                duration,
+            )
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        with self.measure(method, url) as outcome:
+            response = self.session.request(method, url, **kwargs)
+            outcome["status"] = response.status_code
+        return response
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+
+class ThreadSessions:
+    """
+    The session object for the clients taking a single `requests.Session` (like the stripe library one): every call
+    goes to the session of the calling thread (see `OutboundService.session`).
+    """
+
+    def __init__(self, service: OutboundService):
+        self.service = service
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        return self.service.session.request(method, url, **kwargs)
+
+    def close(self) -> None:
+        # The thread sessions (and the shared connection pool) are kept for the process lifetime
+        pass
+
+
+class OutboundStripeClient(stripe.RequestsClient):
+    """
+    The stripe library HTTP client, going through the service (see `apps.py`). It's called from many threads (like the
+    `sync_to_async` ones of the async views), each one with its own session, see `ThreadSessions`.
+    """
+
+    def __init__(self, service: OutboundService):
+        super().__init__(timeout=service.timeout, session=ThreadSessions(service))
+        self.service = service
+
+    def request(self, method, url, headers, post_data=None):
+        with self.service.measure(method.upper(), url) as outcome:
+            result = super().request(method, url, headers, post_data)
+            outcome["status"] = result[1]
+        return result
+
+    def request_stream(self, method, url, headers, post_data=None):
+        with self.service.measure(method.upper(), url) as outcome:
+            result = super().request_stream(method, url, headers, post_data)
+            outcome["status"] = result[1]
+        return result
+
+
+@functools.cache
+def get_outbound_service(name: str) -> OutboundService:
+    """The service client (shared by the process threads), with the `OUTBOUND_HTTP` options"""
+    return OutboundService(name, **settings.OUTBOUND_HTTP.get(name, {}))
+
+
+def get_outbound_stats() -> dict:
+    """The calls statistics of the services used by the process"""
+    names = sorted(settings.OUTBOUND_HTTP)
+    return {name: get_outbound_service(name).stats.as_dict() for name in names}
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+# @module pdf_resources
+# @desc Process-wide cache of the parsed fonts and images used by the pdf documents
+
+import copy
+import inspect
+import threading
+from io import BytesIO
+from pathlib import Path
+
+from fontTools import ttLib
+from fpdf import FPDF
+from fpdf import output as fpdf_output
+from fpdf.drawing import Transform
+from fpdf.svg import SVGObject
+
+__all__ = [
+    "FONT_FAMILY",
+    "add_cached_fonts",
+    "put_cached_svg_image",
+    "drop_unused_fonts",
+    "preload_fonts",
+    "preload_svg_image",
+]
+
+BASE_DIR = Path(__file__).resolve().parent
+FONTS_DIR = BASE_DIR / "fonts"
+
+FONT_FAMILY = "NotoSans"
+FONT_FILES = {
+    "": FONTS_DIR / "NotoSans-Regular.ttf",
+    "B": FONTS_DIR / "NotoSans-Bold.ttf",
+    "I": FONTS_DIR / "NotoSans-Italic.ttf",
+    "BI": FONTS_DIR / "NotoSans-BoldItalic.ttf",
+}
+
+# NOTE: `FPDF.draw_path()` deep-copies the path unless it's asked not to (since fpdf2 2.8.6), and that copy costs
+# more than parsing the svg again. Fall back to the regular `image()` call (from in-memory svg data) otherwise.
+_can_share_svg_paths = "copy" in inspect.signature(FPDF.draw_path).parameters
+
+# NOTE: The fonts selected on the pages are known only with the fpdf2 versions keeping all the page resources in the
+# `ResourceCatalog` (since 2.8), see `drop_unused_fonts`.
+_has_resource_catalog = hasattr(fpdf_output, "ResourceCatalog")
+
+_lock = threading.Lock()
+_fonts: dict[str, tuple[FPDF, dict[str, bytes]]] = {}  # Parsed font prototypes and the raw font files, by family
+_svg_sources: dict[Path, bytes] = {}
+_svg_paths: dict[tuple, object] = {}
+
+
+def _load_fonts(family: str = FONT_FAMILY) -> tuple[FPDF, dict[str, bytes]]:
+    """
+    Parse the font files once per process.
+
+    The prototype fonts are kept in a never rendered `FPDF` instance, as `FPDF.add_font` is the only public way to
+    create them.
+    """
+    cached = _fonts.get(family)
+    if cached:
+        return cached
+    with _lock:
+        cached = _fonts.get(family)
+        if not cached:
+            holder = FPDF()
+            sources = {}
+            for style, fname in FONT_FILES.items():
+                holder.add_font(family, style=style, fname=fname)
+                sources[style] = fname.read_bytes()
+            cached = _fonts[family] = (holder, sources)
+    return cached
+
+
+def _clone_font(proto, pdf: FPDF, source: bytes):
+    """
+    Make a per-document copy of a parsed font.
+
+    The metrics (widths, cmap, glyph ids) are shared, but every document needs its own subset map, descriptor and
+    `ttfont` object: fpdf cuts the embedded glyph subset out of `ttfont` in place when the document is output.
+    """
+    font = copy.copy(proto)
+    font.i = len(pdf.fonts) + 1
+    # The descriptor is a pdf object: it gets the document object id (and the subset font name) on output
+    font.desc = copy.copy(proto.desc)
+    font.ttfont = ttLib.TTFont(BytesIO(source), recalcTimestamp=False, lazy=True)
+    if hasattr(proto, "_hbfont"):
+        # The text shaping font is built from the `ttfont` (and resized) on use
+        font._hbfont = None
+    # Copy the (still empty) subset map of the prototype, pointing it to the new font
+    font.subset = copy.deepcopy(proto.subset, {id(proto): font, id(proto.ttfont): font.ttfont})
+    font.missing_glyphs = []
+    if hasattr(proto, "biggest_size_pt"):
+        font.biggest_size_pt = 0
+    return font
+
+
+def add_cached_fonts(pdf: FPDF, family: str = FONT_FAMILY) -> None:
+    """
+    Register all the styles of the font family in the document, the same way as `FPDF.add_font` does, but without
+    parsing the font files again.
+    """
+    holder, sources = _load_fonts(family)
+    for style in FONT_FILES:
+        fontkey = family.lower() + style
+        if fontkey not in pdf.fonts:
+            pdf.fonts[fontkey] = _clone_font(holder.fonts[fontkey], pdf, sources[style])
+
+
+def _get_svg_source(path: Path) -> bytes:
+    source = _svg_sources.get(path)
+    if source is None:
+        source = _svg_sources[path] = Path(path).read_bytes()
+    return source
+
+
+def _get_svg_paths(path: Path, x: float, y: float, w: float):
+    """
+    Parse the svg and convert it to the drawing paths, placed at the given position (in the same way as `FPDF.image`
+    does for the vector images).
+    """
+    key = (path, x, y, w)
+    paths = _svg_paths.get(key)
+    if paths is None:
+        svg = SVGObject(_get_svg_source(path))
+        if svg.width and svg.height:
+            svg_width, svg_height = svg.width, svg.height
+        else:
+            _, _, svg_width, svg_height = svg.viewbox
+        h = w * svg_height / svg_width
+        _, _, paths = svg.transform_to_rect_viewport(scale=1, width=w, height=h, ignore_svg_top_attrs=True)
+        paths.transform = paths.transform @ Transform.translation(x, y)
+        _svg_paths[key] = paths
+    return paths
+
+
+def put_cached_svg_image(pdf: FPDF, path: Path, x: float, y: float, w: float) -> None:
+    """
+    Put the svg image (with the kept aspect ratio) on the current page.
+
+    Same as `pdf.image(path, x=x, y=y, w=w, keep_aspect_ratio=True)`, but the image is parsed only once per process.
+    """
+    if not _can_share_svg_paths:
+        pdf.image(BytesIO(_get_svg_source(path)), x=x, y=y, w=w, keep_aspect_ratio=True)
+        return
+    paths = _get_svg_paths(path, x, y, w)
+    old_x, old_y = pdf.x, pdf.y
+    pdf.set_xy(0, 0)
+    pdf.draw_path(paths, copy=False)
+    pdf.set_xy(old_x, old_y)
+
+
+def drop_unused_fonts(pdf: FPDF) -> None:
+    """
+    Unregister the fonts (styles) not used in the document, to be called right before the output: fpdf subsets and
+    embeds all the registered fonts, even if they haven't been used at all.
+
+    A font is used if it has any glyphs picked (beyond the reserved ones every new font has) or it's selected on any
+    page.
+    """
+    holders = {fontkey: font for holder, _ in _fonts.values() for fontkey, font in holder.fonts.items()}
+    if _has_resource_catalog:
+        selected = pdf._resource_catalog.get_used_resources(fpdf_output.PDFResourceType.FONT)
+    else:
+        selected = set()
+    for fontkey, font in list(pdf.fonts.items()):
+        proto = holders.get(fontkey)
+        if proto is None or font.i in selected or len(font.subset) > len(proto.subset):
+            continue
+        del pdf.fonts[fontkey]
+
+
+def preload_fonts(family: str = FONT_FAMILY) -> None:
+    _load_fonts(family)
+
+
+def preload_svg_image(path: Path, x: float, y: float, w: float) -> None:
+    if _can_share_svg_paths:
+        _get_svg_paths(path, x, y, w)
+    else:
+        _get_svg_source(path)
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# @module slack
+# @desc Slack notifications: the payments digest text and the webhook posts
+
+from django.conf import settings
+
+from ..constants.payments import currency_emojis
+from .http import get_outbound_service
+
+__all__ = [
+    "format_amount",
+    "get_payment_text",
+    "get_payments_digest",
+    "post_slack_message",
+]
+
+# Payment lines listed under the digest summary, and the titles named in it
+digest_max_lines = 20
+digest_max_titles = 5
+
+
+def format_amount(currency: str, amount: float) -> str:
+    number = f"{amount:.2f}".rstrip("0").rstrip(".")
+    return f"{currency_emojis.get(currency, currency + ' ')}{number}"
+
+
+def get_payment_text(name: str, currency: str, price: float, title: str) -> str:
+    return f"Payment by {name} of {format_amount(currency, price)} for {title}"
+
+
+def get_payments_digest(payments: list[dict]) -> str:
+    """
+    One message for the payments (the dicts with the `get_payment_text` arguments): the summary line, like "37
+    payments totalling 🇪🇺4520 across Autumn School, Summer School and membership", and the first payment lines.
+    """
+    if len(payments) == 1:
+        return get_payment_text(**payments[0])
+    totals: dict[str, float] = {}
+    titles: list[str] = []
+    for payment in payments:
+        totals[payment["currency"]] = totals.get(payment["currency"], 0) + payment["price"]
+        if payment["title"] not in titles:
+            titles.append(payment["title"])
+    if len(titles) > digest_max_titles:
+        titles = titles[:digest_max_titles] + [f"{len(titles) - digest_max_titles} more"]
+    across = titles[0] if len(titles) == 1 else ", ".join(titles[:-1]) + " and " + titles[-1]
+    amounts = ", ".join(format_amount(currency, total) for currency, total in sorted(totals.items()))
+    lines = [f"{len(payments)} payments totalling {amounts} across {across}"]
+    lines += [f"• {get_payment_text(**payment)}" for payment in payments[:digest_max_lines]]
+    if len(payments) > digest_max_lines:
+        lines.append(f"…and {len(payments) - digest_max_lines} more")
+    return "\n".join(lines)
+
+
+def post_slack_message(text: str) -> None:
+    """Post to the `SLACK_WEBHOOK`, raise `requests.RequestException` if it's failed"""
+    get_outbound_service("slack").post(url=settings.SLACK_WEBHOOK, json={"text": text}).raise_for_status()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# @module throttling
+# @desc Cache-backed (approximate) rate limits and concurrency caps for the expensive requests (like the pdf renders)
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache import cache
+
+__all__ = [
+    "Throttled",
+    "take_token",
+    "check_rate",
+    "concurrency_slot",
+]
+
+# Seconds to retry after, when all the concurrency slots are taken (the renders are short)
+slot_retry_after = 2
+# Expiration of the slots counter: it restores the counter if a process died before releasing its slot
+slot_counter_timeout = 5 * 60
+
+# The bucket read and update are not atomic for the cache, so at least the threads of the process are serialized
+_bucket_lock = threading.Lock()
+
+
+class Throttled(Exception):
+    """The request is over the limit and should be retried after `retry_after` seconds"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Throttled, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+def take_token(key: str, capacity: int, refill_seconds: float) -> float:
+    """
+    Take a token from the bucket (of `capacity` tokens, regaining one token every `refill_seconds`), kept in the
+    cache under the key. Return 0 if the token is taken, otherwise the seconds until the next token is available.
+
+    The bucket is kept in the cache (see `CACHES` in the settings), so the processes using the same cache count
+    against it, but the limit is approximate: the bucket read and update are not atomic between the processes, so the
+    concurrent requests from different processes could both take the last token.
+    """
+    cache_key = f"token-bucket:{key}"
+    with _bucket_lock:
+        now = time.time()
+        tokens, stamp = cache.get(cache_key, (capacity, now))
+        tokens = min(capacity, tokens + (now - stamp) / refill_seconds)
+        retry_after = 0 if tokens >= 1 else (1 - tokens) * refill_seconds
+        if not retry_after:
+            tokens -= 1
+        # The bucket is full again (so it may be dropped) when the timeout is expired
+        cache.set(cache_key, (tokens, now), math.ceil((capacity - tokens) * refill_seconds) + 1)
+    return retry_after
+
+
+def check_rate(key: str, capacity: int, refill_seconds: float) -> None:
+    """Take a token (see `take_token`) or raise `Throttled`"""
+    retry_after = take_token(key, capacity, refill_seconds)
+    if retry_after:
+        raise Throttled(retry_after)
+
+
+@contextmanager
+def concurrency_slot(key: str, limit: int):
+    """
+    Run the block only if less than `limit` blocks with the same key are running, otherwise raise `Throttled`. The
+    running blocks are counted in the cache (see `CACHES` in the settings).
+
+    The cap is approximate: the counter updates are atomic only with the cache backends having an atomic `incr` (like
+    redis or memcached). With the file cache, the concurrent requests may both take the last slot, and a lost update
+    may leave the counter off until it expires.
+    """
+    cache_key = f"concurrency:{key}"
+    cache.add(cache_key, 0, slot_counter_timeout)
+    try:
+        count = cache.incr(cache_key)
+    except ValueError:
+        # Expired just now
+        cache.add(cache_key, 1, slot_counter_timeout)
+        count = 1
+    try:
+        if count > limit:
+            raise Throttled(slot_retry_after)
+        yield count
+    finally:
+        try:
+            cache.decr(cache_key)
+        except ValueError:
+            pass
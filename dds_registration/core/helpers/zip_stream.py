@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# @module zip_stream
+# @desc Streaming zip archives writer (for the `StreamingHttpResponse`)
+
+import zipfile
+from typing import Iterable, Iterator
+
+__all__ = [
+    "iter_zip",
+]
+
+
+class ChunksBuffer:
+    """
+    Non-seekable write-only file: collects the data written by `zipfile` until it's taken by `pop()`.
+
+    As the file isn't seekable, `zipfile` never goes back to patch the local headers: it sets the data descriptor flag
+    (0x08) on every entry, writes the CRC and the sizes as 0 in the local header and puts the real values in the data
+    descriptor after the entry data (and in the central directory).
+    """
+
+    def __init__(self):
+        self.chunks: list[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def pop(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def iter_zip(entries: Iterable[tuple[str, bytes]], compression: int = zipfile.ZIP_STORED) -> Iterator[bytes]:
+    """
+    Yield the zip archive data for the `(name, content)` entries, one chunk per entry (plus the final central
+    directory), so only the current entry is kept in memory.
+    """
+    buffer = ChunksBuffer()
+    with zipfile.ZipFile(buffer, "w", compression=compression) as zf:
+        for name, content in entries:
+            zf.writestr(name, content)
+            yield buffer.pop()
+    yield buffer.pop()
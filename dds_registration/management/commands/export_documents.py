@@ -0,0 +1,45 @@
+from datetime import date
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dds_registration.core.helpers.batch_documents import create_combined_documents_pdf
+from dds_registration.core.helpers.create_pdf import output_pdf
+from dds_registration.models import Payment
+
+default_statuses = {
+    "invoice": ("CREATED", "ISSUED"),
+    "receipt": ("PAID",),
+}
+
+
+class Command(BaseCommand):
+    help = "Export the invoices or receipts of the selected payments to one multi-page pdf"
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=default_statuses.keys(), help="Document kind")
+        parser.add_argument("output", type=Path, help="Output pdf file")
+        parser.add_argument("--ids", type=int, nargs="+", help="Payment ids")
+        parser.add_argument("--since", type=date.fromisoformat, help="Created on or after the date (YYYY-MM-DD)")
+        parser.add_argument("--until", type=date.fromisoformat, help="Created on or before the date (YYYY-MM-DD)")
+        parser.add_argument(
+            "--payment-kind", choices=("event", "membership"), help="Payments for events or memberships"
+        )
+
+    def handle(self, *args, **options):
+        kind = options["kind"]
+        qs = Payment.objects.filter(status__in=default_statuses[kind]).order_by("id")
+        if options["ids"]:
+            qs = qs.filter(id__in=options["ids"])
+        if options["since"]:
+            qs = qs.filter(created__gte=options["since"])
+        if options["until"]:
+            qs = qs.filter(created__lte=options["until"])
+        if options["payment_kind"]:
+            qs = qs.filter(data__kind=options["payment_kind"])
+        payments = list(qs)
+        if not payments:
+            raise CommandError(f"No payments with {kind}s found")
+        pdf = create_combined_documents_pdf(payments, kind)
+        options["output"].write_bytes(output_pdf(pdf))
+        self.stdout.write(f"{len(payments)} {kind}(s) exported to {options['output']}\n")
@@ -0,0 +1,93 @@
+import json
+import tarfile
+from datetime import date
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from dds_registration.core.helpers.batch_documents import DocumentsBatch
+from dds_registration.core.helpers.documents import write_file
+from dds_registration.models import Payment
+
+manifest_name = "manifest.json"
+
+# Payment statuses having the documents of the kind
+document_statuses = {
+    "invoice": ("ISSUED", "PAID"),
+    "receipt": ("PAID",),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Export the invoices and receipts of the fiscal year to a folder (and optionally to a tarball). The folder "
+        "manifest keeps the exported document versions and a watermark, so the next runs only render the documents "
+        "of the new or changed payments."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("year", type=int, help="Fiscal (calendar) year of the payments creation")
+        parser.add_argument("folder", type=Path, help="Export folder (updated in place)")
+        parser.add_argument("--tarball", type=Path, help="Also pack the folder to the tar file (.tar.gz: compressed)")
+        parser.add_argument("--workers", type=int, help="Rendering processes (default: PDF_RENDER_WORKERS)")
+        parser.add_argument("--full", action="store_true", help="Ignore the watermark, check all the payments")
+
+    def load_manifest(self, folder: Path, year: int) -> dict:
+        path = folder / manifest_name
+        manifest = json.loads(path.read_text()) if path.exists() else {}
+        if manifest.get("year") != year:
+            manifest = {"year": year, "watermark": None, "documents": {}}
+        return manifest
+
+    def get_changed_payments(self, year: int, watermark: dict | None):
+        """The payments of the year created or updated since the last export (`updated` is a date, so it's inclusive)"""
+        qs = Payment.objects.filter(created__year=year).order_by("id")
+        if watermark:
+            qs = qs.filter(Q(id__gt=watermark["last_id"]) | Q(updated__gte=watermark["updated"]))
+        return list(qs)
+
+    def handle(self, *args, **options):
+        year, folder = options["year"], options["folder"]
+        manifest = self.load_manifest(folder, year)
+        documents = manifest["documents"]
+        payments = self.get_changed_payments(year, None if options["full"] else manifest["watermark"])
+
+        written = removed = 0
+        for kind, statuses in document_statuses.items():
+            outdated = []
+            for payment in payments:
+                name = f"{kind}s/DdS {kind} {payment.invoice_no}.pdf"
+                if payment.status not in statuses:
+                    if documents.pop(name, None):
+                        (folder / name).unlink(missing_ok=True)
+                        removed += 1
+                    continue
+                version = payment.document_version(kind)
+                if documents.get(name, {}).get("version") != version or not (folder / name).exists():
+                    outdated.append((payment, name, version))
+            batch = DocumentsBatch([payment for payment, _, _ in outdated], kind, workers=options["workers"])
+            for (payment, name, version), (_, content) in zip(outdated, batch, strict=True):
+                write_file(folder / name, content)
+                documents[name] = {"payment": payment.id, "version": version}
+                written += 1
+            if outdated:
+                self.stdout.write(f"Exported {batch.summary}\n")
+
+        if payments:
+            watermark = manifest["watermark"] or {"last_id": 0, "updated": date.min.isoformat()}
+            manifest["watermark"] = {
+                "last_id": max(watermark["last_id"], payments[-1].id),
+                "updated": max([watermark["updated"]] + [payment.updated.isoformat() for payment in payments]),
+            }
+        write_file(folder / manifest_name, (json.dumps(manifest, indent=2, sort_keys=True) + "\n").encode("utf-8"))
+
+        if options["tarball"]:
+            mode = "w:gz" if options["tarball"].suffix in (".gz", ".tgz") else "w"
+            with tarfile.open(options["tarball"], mode) as tar:
+                tar.add(folder, arcname=f"dds-documents-{year}")
+
+        self.stdout.write(
+            f"{year}: {len(payments)} payment(s) checked, {written} document(s) written, {removed} removed, "
+            f"{len(documents)} in total\n"
+        )
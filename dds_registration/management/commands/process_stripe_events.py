@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from dds_registration.models import StripeEvent
+
+
+class Command(BaseCommand):
+    help = (
+        "Process the stored Stripe webhook events (complete the paid payments), retrying the failed ones with a growing "
+        "delay. Runs until stopped, or until the due events are processed with --once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Process the due events and exit")
+        parser.add_argument("--interval", type=float, default=2, help="Seconds to wait when there's nothing to process")
+        parser.add_argument("--batch-size", type=int, default=20, help="Events taken at once")
+
+    def process_batch(self, batch_size: int) -> tuple[int, int]:
+        """
+        Process the next batch of due events, return the numbers of the processed and failed ones. The events are
+        taken (see `StripeEvent.claim_next`) and processed one at a time, every one in its own transaction, so the
+        other database writers wait at most for a single event.
+        """
+        processed = failed = 0
+        for _ in range(batch_size):
+            event = StripeEvent.claim_next()
+            if event is None:
+                break
+            if event.process():
+                processed += 1
+            else:
+                failed += 1
+        return processed, failed
+
+    def handle(self, *args, **options):
+        while True:
+            processed, failed = self.process_batch(options["batch_size"])
+            if processed or failed:
+                self.stdout.write(f"{processed} Stripe event(s) processed, {failed} failed\n")
+            if processed + failed < options["batch_size"]:
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dds_registration.models import Message
+
+
+class Command(BaseCommand):
+    help = (
+        "Send the messages to their recipients: the given ones, or the ones queued in the admin (runs until stopped "
+        "then, or until they're sent with --once). The delivered recipients are skipped, so an interrupted broadcast "
+        "can be resumed, or split across several runs (with --limit) or parallel workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("ids", type=int, nargs="*", help="Message ids (the queued messages if none)")
+        parser.add_argument("--limit", type=int, help="Max recipients per message in this run")
+        parser.add_argument("--once", action="store_true", help="Send the queued messages and exit")
+        parser.add_argument("--interval", type=float, default=5, help="Seconds to wait when there's nothing to send")
+
+    def send_messages(self, messages: list[Message], limit: int | None) -> int:
+        """Send the messages, return the number of the recipients they're sent to now"""
+        sent = 0
+        for message in messages:
+            count = message.send_email(limit=limit)
+            sent += count
+            delivered = message.deliveries.filter(sent_at__isnull=False).count()
+            total = message.deliveries.count()
+            status = "done" if message.emailed else "not finished"
+            self.stdout.write(
+                f"{message}: sent to {count} recipient(s) now, {delivered} of {total} in total ({status})\n"
+            )
+        return sent
+
+    def handle(self, *args, **options):
+        if options["ids"]:
+            messages = list(Message.objects.filter(id__in=options["ids"]).order_by("id"))
+            if not messages:
+                raise CommandError("No messages found")
+            self.send_messages(messages, options["limit"])
+            return
+        while True:
+            if not self.send_messages(list(Message.get_queued()), options["limit"]):
+                # None queued (or their deliveries are being sent by the other workers)
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
@@ -0,0 +1,47 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from dds_registration.models import OutboxEmail
+
+
+class Command(BaseCommand):
+    help = (
+        "Send the outbox emails in batches, retrying the failed ones with a growing delay. Runs until stopped, or "
+        "until the due emails are sent with --once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Send the due emails and exit")
+        parser.add_argument("--interval", type=float, default=5, help="Seconds to wait when there's nothing to send")
+        parser.add_argument(
+            "--batch-size", type=int, default=settings.EMAIL_OUTBOX_BATCH_SIZE, help="Emails taken at once"
+        )
+
+    def send_batch(self, batch_size: int) -> tuple[int, int]:
+        """
+        Send the next batch of due emails, return the numbers of the sent and failed ones. Every email is claimed by
+        a conditional update of its own (see `OutboxEmail.claim`) and sent with no transaction open, so the requests
+        putting the emails to the outbox meanwhile don't wait for the database.
+        """
+        sent = failed = 0
+        for _ in range(batch_size):
+            email = OutboxEmail.claim_next()
+            if email is None:
+                break
+            if email.send():
+                sent += 1
+            else:
+                failed += 1
+        return sent, failed
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = self.send_batch(options["batch_size"])
+            if sent or failed:
+                self.stdout.write(f"{sent} email(s) sent, {failed} failed\n")
+            if sent + failed < options["batch_size"]:
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from dds_registration.models import SlackNotification
+
+
+class Command(BaseCommand):
+    help = (
+        "Post the pending payment notifications to Slack as one digest message every interval. Runs until stopped, or "
+        "posts the pending ones and exits with --once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Post the pending notifications and exit")
+        parser.add_argument(
+            "--interval", type=float, default=settings.SLACK_DIGEST_INTERVAL, help="Seconds between the digests"
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            count = SlackNotification.send_digest()
+            if count:
+                self.stdout.write(f"{count} payment notification(s) posted\n")
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
@@ -1,27 +1,41 @@
 import re
 
+from asgiref.sync import iscoroutinefunction
 from bs4 import BeautifulSoup
 from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
 
 # Single- and multi-line comments
 re_comments = re.compile("<!--(.*?|(?:\n.*?)*?)-->", re.MULTILINE)
 
 
+def prettify_response(response):
+    # TODO: Do this conversion only in prod mode
+    if not settings.DEV and response.status_code == 200 and response["content-type"].startswith("text/html"):
+        content = response.content.decode("utf-8")
+        # Remove comments
+        content = re_comments.sub("", content)
+        # Prettify
+        beauty = BeautifulSoup(content, "html.parser")
+        response.content = beauty.prettify()
+    return response
+
+
+@sync_and_async_middleware
 def BeautifulMiddleware(get_response):
     """
-    Prettify html output middleware.
+    Prettify html output middleware. It supports the async requests too, so the async views (under ASGI) aren't run
+    through a sync thread.
     """
 
+    if iscoroutinefunction(get_response):
+
+        async def async_middleware(request):
+            return prettify_response(await get_response(request))
+
+        return async_middleware
+
     def middleware(request):
-        response = get_response(request)
-        # TODO: Do this conversion only in prod mode
-        if not settings.DEV and response.status_code == 200 and response["content-type"].startswith("text/html"):
-            content = response.content.decode("utf-8")
-            # Remove comments
-            content = re_comments.sub("", content)
-            # Prettify
-            beauty = BeautifulSoup(content, "html.parser")
-            response.content = beauty.prettify()
-        return response
+        return prettify_response(get_response(request))
 
     return middleware
@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+import dds_registration.models
+
+
+def fill_checkin_codes(apps, schema_editor):
+    Registration = apps.get_model('dds_registration', 'Registration')
+    codes = set()
+    for registration in Registration.objects.only('id').iterator():
+        code = dds_registration.models.random_checkin_code()
+        while code in codes:
+            code = dds_registration.models.random_checkin_code()
+        codes.add(code)
+        Registration.objects.filter(id=registration.id).update(checkin_code=code)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dds_registration', '0012_event_application_rejected_email_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registration',
+            name='checkin_code',
+            field=models.CharField(editable=False, max_length=16, null=True),
+        ),
+        migrations.RunPython(fill_checkin_codes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='registration',
+            name='checkin_code',
+            field=models.CharField(
+                default=dds_registration.models.random_checkin_code, editable=False, max_length=16, unique=True
+            ),
+        ),
+        migrations.AddField(
+            model_name='registration',
+            name='checked_in_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
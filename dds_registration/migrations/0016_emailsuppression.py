@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dds_registration', '0015_messagedelivery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailSuppression',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254, unique=True)),
+                ('reason', models.TextField(choices=[('BOUNCE', 'Bounce'), ('BLOCKED', 'Blocked'), ('SPAMREPORT', 'Spam report')])),
+                ('details', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='outboxemail',
+            name='status',
+            field=models.TextField(choices=[('PENDING', 'Pending'), ('SENT', 'Sent'), ('FAILED', 'Failed'), ('SUPPRESSED', 'Suppressed')], default='PENDING'),
+        ),
+    ]
@@ -1,9 +1,12 @@
 # @module models.py
 # @changed 2024.03.28, 19:28
 
+import logging
 import random
 import string
-from datetime import date
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Iterable
 
 import requests
 from django.conf import settings
@@ -11,14 +14,15 @@ from django.contrib import admin
 from django.contrib.auth.models import AbstractUser
 from django.contrib.sites.models import Site
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import models
-from django.db.models import Model, Q, QuerySet
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Model, Q, QuerySet
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.safestring import SafeString, mark_safe
 from fpdf import FPDF
 
 from .core.constants.date_time_formats import dateFormat
 from .core.constants.payments import (
-    currency_emojis,
     payment_details_by_currency,
     site_default_currency,
     site_supported_currencies,
@@ -26,9 +30,23 @@ from .core.constants.payments import (
 from .core.helpers.create_pdf import (
     create_invoice_pdf_from_payment,
     create_receipt_pdf_from_payment,
+    output_pdf,
 )
 from .core.helpers.dates import this_year
-from .core.helpers.email import send_email
+from .core.helpers.document_preview import get_document_preview, render_document_preview
+from .core.helpers.documents import (
+    delete_payment_documents,
+    ensure_document,
+    get_document,
+    get_document_path,
+    get_document_version,
+    sign_document_link,
+)
+from .core.helpers.email import max_personalizations, normalize_address, send_broadcast, send_email
+from .core.helpers.errors import errorToString
+from .core.helpers.slack import get_payments_digest, post_slack_message
+
+LOG = logging.getLogger(__name__)
 
 alphabet = string.ascii_lowercase + string.digits
 random_code_length = 8
@@ -42,6 +60,19 @@ def random_code(length=random_code_length):
     return "".join(random.choices(alphabet, k=length))
 
 
+# Check-in codes are typed in at the event door: short, upper case, without the look-alike characters (0/O, 1/I)
+checkin_code_alphabet = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+checkin_code_length = 6
+# New codes tried before giving up, if the generated ones are taken (rare: there are ~10^9 codes)
+checkin_code_attempts = 10
+# The due outbox emails (or Stripe events) tried by a worker to claim one, while the other workers take them too
+claim_candidates = 10
+
+
+def random_checkin_code():
+    return "".join(random.choices(checkin_code_alphabet, k=checkin_code_length))
+
+
 class User(AbstractUser):
 
     # NOTE: It seems to be imposible to completely remove the `username` because it's used in django_registration
@@ -130,16 +161,21 @@ class User(AbstractUser):
         subject: str,
         message: str,
         html_content: bool = False,
-        attachment_content: FPDF | None = None,
+        attachment_content: FPDF | bytes | None = None,
         attachment_name: str | None = None,
         from_email: str | None = settings.DEFAULT_FROM_EMAIL,
     ) -> None:
-        send_email(
-            recipient_address=self.email,
+        """Put the email to the outbox, it's sent by the `send_outbox_emails` worker (unless the address is suppressed)"""
+        if EmailSuppression.get_suppressed([self.email]):
+            return
+        OutboxEmail.enqueue(
+            recipient=self.email,
             subject=subject,
             message=message,
-            pdf=attachment_content,
-            pdf_name=attachment_name,
+            is_html=html_content,
+            from_email=from_email,
+            attachment_content=attachment_content,
+            attachment_name=attachment_name,
         )
 
 
@@ -207,6 +243,25 @@ class Payment(Model):
     # }
     data = models.JSONField(help_text="Read-only JSON object", default=dict)
 
+    # The `data` fields which are rendered in the invoice and receipt documents
+    DOCUMENT_DATA_FIELDS = ("kind", "user", "extra", "event", "option", "membership", "until", "price", "currency")
+    DOCUMENT_KINDS = ("invoice", "receipt")
+
+    # This variable is used to determine if status has changed on save
+    _original_status = None
+
+    def __init__(self, *args, **kwargs):
+        super(Payment, self).__init__(*args, **kwargs)
+        self._original_status = self.status
+
+    def save(self, *args, **kwargs):
+        status_changed = self.status != self._original_status
+        result = super().save(*args, **kwargs)
+        if status_changed:
+            self._original_status = self.status
+            self.update_documents()
+        return result
+
     def __str__(self):
         return "Payment {} | {} {:.2f} | {} | {}".format(
             self.id,
@@ -222,10 +277,9 @@ class Payment(Model):
         Normally for when they change their mind on event registration options."""
         if self.status == "OBSOLETE":
             return
-        self.status == "OBSOLETE"
+        self.status = "OBSOLETE"
         user = User.objects.get(id=self.data["user"]["id"])
-        send_email(
-            recipient_address=user.email,
+        user.email_user(
             subject=f"Invoice #{self.invoice_no} is obsolete - please do not pay",
             message=f"Invoice {self.invoice_no} is obsolete - {self.data['user']['name']} changed their mind and chose a different item with a different price. An updated invoice will be sent. Please do not pay invoice {self.invoice_no}.\n\nIf you have questions, please contact events@d-d-s.ch. Thanks!",
         )
@@ -237,18 +291,21 @@ class Payment(Model):
         self.status = "PAID"
         self.data["paid_date"] = date.today().strftime("%Y-%m-%d")
         if settings.SLACK_WEBHOOK:
-            title = self.data["event"]["title"] if self.data["kind"] == "event" else "membership"
-            requests.post(
-                url=settings.SLACK_WEBHOOK,
-                json={
-                    "text": "Payment by {} of {}{} for {}".format(
-                        self.data["user"]["name"], currency_emojis[self.data["currency"]], self.data["price"], title
-                    )
-                },
-            )
+            # Posted by the `send_slack_digests` worker, combined with the other payments of the time
+            SlackNotification.add_payment(self)
         self.email_receipt()
         self.save()
 
+    def complete_stripe_payment(self):
+        """
+        Mark the payment made with Stripe paid (the charged amount, with the card fees, becomes the price) and complete
+        the event registration. Called by the Stripe webhook events processing (see `StripeEvent`).
+        """
+        self.data["price"] = self.data.pop("stripe_charge_in_progress", self.data["price"])
+        self.mark_paid()
+        if self.data["kind"] == "event":
+            Registration.objects.get(id=self.data["registration"]["id"]).complete_registration()
+
     @property
     def invoice_no(self):
         """
@@ -293,31 +350,119 @@ class Payment(Model):
     def receipt_pdf(self):
         return create_receipt_pdf_from_payment(self)
 
+    def document_version(self, kind: str) -> str:
+        values = {key: self.data.get(key) for key in self.DOCUMENT_DATA_FIELDS}
+        values["invoice_no"] = self.invoice_no
+        if kind == "invoice":
+            values["invoice_date"] = self.updated
+        else:
+            values["paid_date"] = self.data.get("paid_date")
+        return get_document_version(values)
+
+    def document_path(self, kind: str):
+        return get_document_path(self.id, kind, self.document_version(kind))
+
+    def render_document(self, kind: str) -> bytes:
+        pdf = self.invoice_pdf() if kind == "invoice" else self.receipt_pdf()
+        return output_pdf(pdf)
+
+    def get_document(self, kind: str) -> bytes:
+        """
+        Rendered invoice or receipt pdf. It's taken from the documents store, and it's rendered only if the relevant
+        payment details have changed since the last time.
+        """
+        if kind not in self.DOCUMENT_KINDS:
+            raise ValueError(f"Unknown document kind: {kind}")
+        return get_document(self.document_path(kind), lambda: self.render_document(kind))
+
+    def get_document_file(self, kind: str) -> Path:
+        """Path of the stored invoice or receipt pdf (see `get_document`), to be sent as a file"""
+        if kind not in self.DOCUMENT_KINDS:
+            raise ValueError(f"Unknown document kind: {kind}")
+        path = self.document_path(kind)
+        ensure_document(path, lambda: self.render_document(kind))
+        return path
+
+    def get_document_preview(self, kind: str) -> SafeString:
+        """
+        Html preview of the invoice or receipt, to show it inline without rendering the pdf. It's cached per document
+        version, as the stored pdf.
+        """
+        if kind not in self.DOCUMENT_KINDS:
+            raise ValueError(f"Unknown document kind: {kind}")
+        key = f"payment-document-preview:{self.id}:{kind}:{self.document_version(kind)}"
+        return mark_safe(get_document_preview(key, lambda: render_document_preview(self, kind)))
+
+    @property
+    def preview_document_kind(self) -> str | None:
+        """The document offered to the user for the current status (as the profile download links)"""
+        if self.status == "PAID":
+            return "receipt"
+        if self.has_unpaid_invoice:
+            return "invoice"
+        return None
+
+    @property
+    def document_preview(self) -> SafeString:
+        kind = self.preview_document_kind
+        return self.get_document_preview(kind) if kind else mark_safe("")
+
+    def update_documents(self):
+        """Render the document for the new payment status in advance, or drop the no longer valid ones"""
+        if self.status == "ISSUED":
+            ensure_document(self.document_path("invoice"), lambda: self.render_document("invoice"))
+        elif self.status == "PAID":
+            ensure_document(self.document_path("receipt"), lambda: self.render_document("receipt"))
+        elif self.status in ("OBSOLETE", "REFUNDED"):
+            delete_payment_documents(self.id)
+
+    @property
+    def send_document_links(self) -> bool:
+        """Email the documents as the signed download links (see `DOCUMENT_EMAIL_MODE`) instead of the attachments"""
+        return settings.DOCUMENT_EMAIL_MODE == "link"
+
+    def get_document_link(self, kind: str) -> str:
+        """
+        The document download link, for the emails. It's signed (and expires, see `DOCUMENT_LINK_MAX_AGE`), so it can
+        be used without login, and the document is rendered only when it's downloaded.
+        """
+        return "https://{}{}".format(
+            Site.objects.get_current().domain,
+            reverse("document_link_download", args=(self.id, kind, sign_document_link(self.id, kind))),
+        )
+
+    def get_document_email_text(self, kind: str, label: str) -> str:
+        if self.send_document_links:
+            return f"You can download {label} here: {self.get_document_link(kind)}"
+        return f"Please find attached {label}."
+
+    def get_document_email_attachment(self, kind: str) -> dict:
+        if self.send_document_links:
+            return {}
+        return dict(
+            attachment_content=self.get_document(kind),
+            attachment_name=f"DdS {'Invoice' if kind == 'invoice' else 'receipt'} {self.invoice_no}.pdf",
+        )
+
     def email_invoice(self):
         user = User.objects.get(id=self.data["user"]["id"])
         # TODO: Issue #149: To extract these (and all other hardcoded here, in `send_email` methods?) texts to template files, with substiting names, urls and emails from settings or preferences values?
         if self.data["kind"] == "membership":
             subject = f"DdS Membership Invoice {self.invoice_no}"
-            message = f"Thanks for signing up for Départ de Sentier membership! Membership fees allow us to write awesome open source code, deploy open infrastructure, and run community events without spending all our time fundraising.\n\nYour membership will run until December 31st, {user.membership.until} (Don't worry, you will get a reminder to renew for another year :).\n\nPlease find attached the membership invoice. Your membership is not in force until the bank transfer is received.\n\nYou can change your invoice details here: https://events.d-d-s.ch{reverse('membership_application')}.\n\nIf you have any questions, please contact events@d-d-s.ch."
+            message = f"Thanks for signing up for Départ de Sentier membership! Membership fees allow us to write awesome open source code, deploy open infrastructure, and run community events without spending all our time fundraising.\n\nYour membership will run until December 31st, {user.membership.until} (Don't worry, you will get a reminder to renew for another year :).\n\n{self.get_document_email_text('invoice', 'the membership invoice')} Your membership is not in force until the bank transfer is received.\n\nYou can change your invoice details here: https://events.d-d-s.ch{reverse('membership_application')}.\n\nIf you have any questions, please contact events@d-d-s.ch."
         else:
             event = Event.objects.get(id=self.data["event"]["id"])
             subject = f"DdS Event {event.title} Registration Invoice {self.invoice_no}"
-            message = f"Thanks for registering for {event.title}! We look forward to seeing your, in person or virtually.\n\nDépart de Sentier runs its events and schools on a cost-neutral basis - i.e. we don't make a profit off the registration fees. They are used for catering, room, hotel, and equipment rental, AV hosting and technician fees, and guest speaker costs. We literally could not run this event without your support.\n\nYou can view your registration status and apply for membership at https://events.d-d-s.ch/profile.\n\nPlease find attached the registration invoice. Your registration is not finalized until the bank transfer is received.\n\nYou can change your invoice details here: https://events.d-d-s.ch{reverse('event_registration', args=(event.code,))}.\n\nIf you have any questions, please contact events@d-d-s.ch."
-        user.email_user(
-            subject=subject,
-            message=message,
-            attachment_content=self.invoice_pdf(),
-            attachment_name=f"DdS Invoice {self.invoice_no}.pdf",
-        )
+            message = f"Thanks for registering for {event.title}! We look forward to seeing your, in person or virtually.\n\nDépart de Sentier runs its events and schools on a cost-neutral basis - i.e. we don't make a profit off the registration fees. They are used for catering, room, hotel, and equipment rental, AV hosting and technician fees, and guest speaker costs. We literally could not run this event without your support.\n\nYou can view your registration status and apply for membership at https://events.d-d-s.ch/profile.\n\n{self.get_document_email_text('invoice', 'the registration invoice')} Your registration is not finalized until the bank transfer is received.\n\nYou can change your invoice details here: https://events.d-d-s.ch{reverse('event_registration', args=(event.code,))}.\n\nIf you have any questions, please contact events@d-d-s.ch."
+        user.email_user(subject=subject, message=message, **self.get_document_email_attachment("invoice"))
 
     def email_receipt(self):
         user = User.objects.get(id=self.data["user"]["id"])
         kind = "Membership" if self.data["kind"] == "membership" else "Event"
         user.email_user(
             subject=f"DdS {kind} Receipt {self.invoice_no}",
-            message="Thanks! A receipt for your event or membership payment is attached. You can always find more information about your item at your your profile: https://events.d-d-s.ch/profile.\n\nWe really appreciate your support. If you have any questions, please contact events@d-d-s.ch.",
-            attachment_content=self.receipt_pdf(),
-            attachment_name=f"DdS receipt {self.invoice_no}.pdf",
+            message=f"Thanks! {self.get_document_email_text('receipt', 'a receipt for your event or membership payment')} You can always find more information about your item at your your profile: https://events.d-d-s.ch/profile.\n\nWe really appreciate your support. If you have any questions, please contact events@d-d-s.ch.",
+            **self.get_document_email_attachment("receipt"),
         )
 
 
@@ -460,6 +605,10 @@ class Event(Model):
             Site.objects.get_current().domain, reverse("event_registration", args=(self.code,))
         )
 
+    @property
+    def checkin_url(self):
+        return "https://{}{}".format(Site.objects.get_current().domain, reverse("event_checkin", args=(self.code,)))
+
     def __str__(self):
         name_items = [
             self.title,
@@ -506,23 +655,101 @@ class Message(Model):
     def __str__(self):
         return "{}: {} ({})".format(self.event or "Members", self.subject[:50], "sent" if self.emailed else "not sent")
 
-    def send_email(self):
+    @property
+    def email_subject(self) -> str:
+        if self.for_members:
+            return self.subject or "DdS email for members"
+        return self.subject or f"Update for DdS Event {self.event.title}"
+
+    def get_recipients(self) -> QuerySet:
+        if self.for_members:
+            return Membership.mailinglist_people()
+        return Registration.objects.filter(REGISTRATION_ACTIVE_QUERY, event__id=self.event_id)
+
+    def create_deliveries(self) -> None:
+        """Add the delivery records for the (new) recipients, in one bulk insert"""
+        addresses = {
+            normalize_address(address) for address in self.get_recipients().values_list("user__email", flat=True)
+        }
+        addresses -= EmailSuppression.get_suppressed(addresses)
+        MessageDelivery.objects.bulk_create(
+            [MessageDelivery(message=self, email=address) for address in sorted(addresses) if address],
+            ignore_conflicts=True,
+        )
+
+    @classmethod
+    def get_queued(cls) -> QuerySet:
+        """The messages put to the delivery queue (see `enqueue`) and not delivered to all the recipients yet"""
+        return cls.objects.filter(emailed=False, deliveries__sent_at__isnull=True).distinct().order_by("id")
+
+    def enqueue(self) -> int:
+        """
+        Put the message to the delivery queue, sent by the `send_message` worker: add the deliveries for its (new)
+        recipients. Return the number of the recipients it's still to be sent to.
+        """
         if self.emailed:
             return 0
+        self.create_deliveries()
+        pending = self.deliveries.filter(sent_at__isnull=True).count()
+        if not pending:
+            self.emailed = True
+            self.save(update_fields=["emailed"])
+        return pending
+
+    def claim_deliveries(self, batch_size: int) -> list["MessageDelivery"]:
+        """
+        Take the next batch of the deliveries to send: they're claimed for `EMAIL_OUTBOX_CLAIM_TIMEOUT` by one
+        conditional update (of the ones still unclaimed, or claimed by a worker that died before recording them), so
+        the other workers skip them while they're being sent. The batch may be short if another worker has claimed
+        some of them meanwhile (it's empty when there's nothing left to claim).
+        """
+        now = timezone.now()
+        claimed_until = now + timedelta(seconds=settings.EMAIL_OUTBOX_CLAIM_TIMEOUT)
+        claimable = self.deliveries.filter(
+            Q(claimed_until__isnull=True) | Q(claimed_until__lt=now), sent_at__isnull=True
+        )
+        while True:
+            candidate_ids = list(claimable.order_by("id").values_list("id", flat=True)[:batch_size])
+            if not candidate_ids:
+                return []
+            claimable.filter(id__in=candidate_ids).update(claimed_until=claimed_until)
+            batch = list(
+                MessageDelivery.objects.filter(id__in=candidate_ids, claimed_until=claimed_until).order_by("id")
+            )
+            if batch:
+                return batch
+            # All of them were taken by the other workers: try the next ones
 
-        if self.for_members:
-            qs = Membership.mailinglist_people()
-            for obj in qs:
-                obj.user.email_user(subject=self.subject or "DdS email for members", message=self.message)
-        else:
-            qs = Registration.objects.filter(REGISTRATION_ACTIVE_QUERY, event__id=self.event_id)
-            for obj in qs:
-                obj.user.email_user(
-                    subject=self.subject or f"Update for DdS Event {self.event.title}", message=self.message
-                )
-        self.emailed = True
-        self.save()
-        return qs.count()
+    def send_email(self, limit: int | None = None) -> int:
+        """
+        Send the message to the recipients it hasn't been delivered to yet (at most `limit` of them), return the number
+        of the recipients it's sent to now.
+
+        Every batch (see `send_broadcast`) is claimed (see `claim_deliveries`), sent with no transaction open and
+        marked delivered as soon as it's sent, so an interrupted broadcast is resumed without sending twice, and
+        several workers can share it. A failed batch is released for the next attempt.
+        """
+        if self.emailed:
+            return 0
+        self.create_deliveries()
+        count = 0
+        while limit is None or count < limit:
+            batch_size = max_personalizations if limit is None else min(max_personalizations, limit - count)
+            batch = self.claim_deliveries(batch_size)
+            if not batch:
+                break
+            batch_ids = [delivery.id for delivery in batch]
+            try:
+                send_broadcast([delivery.email for delivery in batch], subject=self.email_subject, message=self.message)
+            except Exception:
+                MessageDelivery.objects.filter(id__in=batch_ids).update(claimed_until=None)
+                raise
+            MessageDelivery.objects.filter(id__in=batch_ids).update(sent_at=timezone.now(), claimed_until=None)
+            count += len(batch)
+        if not self.deliveries.filter(sent_at__isnull=True).exists():
+            self.emailed = True
+            self.save(update_fields=["emailed"])
+        return count
 
     class Meta:
         constraints = [
@@ -542,6 +769,23 @@ class Message(Model):
         ]
 
 
+class MessageDelivery(Model):
+    """The message recipient, and when the message is sent to them"""
+
+    message = models.ForeignKey(Message, related_name="deliveries", on_delete=models.CASCADE)
+    email = models.EmailField()
+    sent_at = models.DateTimeField(null=True, blank=True)
+    claimed_until = models.DateTimeField(null=True, blank=True)  # Being sent by a worker (see `claim_deliveries`)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["message", "email"], name="Single delivery per message recipient"),
+        ]
+
+    def __str__(self):
+        return "{} to {} ({})".format(self.message_id, self.email, "sent" if self.sent_at else "not sent")
+
+
 class Registration(Model):
     REGISTRATION_STATUS = [
         # For schools
@@ -566,6 +810,8 @@ class Registration(Model):
     )
     status = models.TextField(choices=REGISTRATION_STATUS)
     send_update_emails = models.BooleanField(default=True)
+    checkin_code = models.CharField(max_length=16, unique=True, default=random_checkin_code, editable=False)
+    checked_in_at = models.DateTimeField(null=True, blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -579,10 +825,40 @@ class Registration(Model):
             )
         ]
 
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.ensure_free_checkin_code()
+        return super().save(*args, **kwargs)
+
+    def ensure_free_checkin_code(self) -> None:
+        """
+        Replace the (random) check-in code if another registration has it already, so a collision doesn't fail the
+        insert. Raises `IntegrityError` if no free code is found in `checkin_code_attempts` tries.
+        """
+        for _ in range(checkin_code_attempts):
+            if not Registration.objects.filter(checkin_code=self.checkin_code).exists():
+                return
+            self.checkin_code = random_checkin_code()
+        raise IntegrityError("No free registration check-in code found")
+
     @classmethod
     def active_for_user(cls, user: User) -> QuerySet:
         return cls.objects.filter(REGISTRATION_ACTIVE_QUERY, user=user)
 
+    @classmethod
+    def get_by_checkin_code(cls, event: Event, code: str) -> "Registration":
+        """Find the event registration by the check-in code (a unique index lookup), raises `DoesNotExist`"""
+        return cls.objects.select_related("user", "option").get(checkin_code=code.strip().upper(), event=event)
+
+    def check_in(self) -> bool:
+        """Mark the attendee as arrived, return False if it's been done already"""
+        updated = Registration.objects.filter(id=self.id, checked_in_at__isnull=True).update(
+            checked_in_at=timezone.now()
+        )
+        if updated:
+            self.refresh_from_db(fields=["checked_in_at"])
+        return bool(updated)
+
     def accept_application(self):
         """Change status from SUBMITTED to SELECTED"""
         self.status = "SELECTED"
@@ -619,3 +895,413 @@ class Registration(Model):
         ]
         info = ", ".join(filter(None, map(str, items)))
         return info
+
+
+class OutboxEmail(Model):
+    """
+    An email waiting to be sent (or already sent) by the `send_outbox_emails` worker. The requests only put the
+    emails here, so they don't wait for the SendGrid calls, and the failed sends are retried with a growing delay.
+    """
+
+    STATUS = [
+        ("PENDING", "Pending"),
+        ("SENT", "Sent"),
+        ("FAILED", "Failed"),  # Gave up after `EMAIL_OUTBOX_MAX_ATTEMPTS`
+        ("SUPPRESSED", "Suppressed"),  # Not sent, the recipient is in the suppression list
+    ]
+
+    recipient = models.EmailField()
+    subject = models.TextField()
+    message = models.TextField()
+    is_html = models.BooleanField(default=False)
+    from_email = models.TextField(blank=True, default="")  # `DEFAULT_FROM_EMAIL` if empty
+    attachment_content = models.BinaryField(null=True, blank=True)
+    attachment_name = models.TextField(blank=True, default="")
+    status = models.TextField(choices=STATUS, default="PENDING")
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_email_due"),
+        ]
+
+    @classmethod
+    def enqueue(
+        cls,
+        recipient: str,
+        subject: str,
+        message: str,
+        is_html: bool = False,
+        from_email: str | None = None,
+        attachment_content: FPDF | bytes | None = None,
+        attachment_name: str | None = None,
+    ) -> "OutboxEmail":
+        if attachment_content and not attachment_name:
+            raise ValueError("Must specify `attachment_name`")
+        if isinstance(attachment_content, FPDF):
+            attachment_content = output_pdf(attachment_content)
+        return cls.objects.create(
+            recipient=recipient,
+            subject=subject,
+            message=message,
+            is_html=is_html,
+            from_email=from_email or "",
+            attachment_content=attachment_content or None,
+            attachment_name=attachment_name or "",
+        )
+
+    @classmethod
+    def get_due(cls) -> QuerySet:
+        return cls.objects.filter(status="PENDING", next_attempt_at__lte=timezone.now()).order_by(
+            "next_attempt_at", "id"
+        )
+
+    @classmethod
+    def claim_next(cls) -> "OutboxEmail | None":
+        """Take the next due email to send (see `claim`), if any"""
+        for email in cls.get_due()[:claim_candidates]:
+            if email.claim():
+                return email
+        return None
+
+    def claim(self) -> bool:
+        """
+        Claim the due email for sending: the attempt is counted and the next one is put off by
+        `EMAIL_OUTBOX_CLAIM_TIMEOUT` in one conditional update, so the other workers skip the email while it's being
+        sent (and it's retried if the worker dies before recording the result). Return False if it's been claimed by
+        another worker since it's read.
+        """
+        now = timezone.now()
+        next_attempt_at = now + timedelta(seconds=settings.EMAIL_OUTBOX_CLAIM_TIMEOUT)
+        claimed = OutboxEmail.objects.filter(
+            id=self.id, status="PENDING", attempts=self.attempts, next_attempt_at__lte=now
+        ).update(attempts=F("attempts") + 1, next_attempt_at=next_attempt_at)
+        if claimed:
+            self.attempts += 1
+            self.next_attempt_at = next_attempt_at
+        return bool(claimed)
+
+    def get_retry_delay(self) -> float:
+        """Seconds before the next attempt: doubled after every failure, up to the max delay"""
+        delay = settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** max(0, self.attempts - 1)
+        return min(delay, settings.EMAIL_OUTBOX_MAX_RETRY_DELAY)
+
+    def send(self) -> bool:
+        """
+        Try to send the claimed email (see `claim_next`), record the result. Return False if it's failed.
+
+        Must be called with no transaction open: the SendGrid call would hold the database locks of the transaction
+        for its whole duration, and a rollback would forget that the email is sent already.
+        """
+        try:
+            sent = send_email(
+                recipient_address=self.recipient,
+                subject=self.subject,
+                message=self.message,
+                is_html=self.is_html,
+                from_email=self.from_email or settings.DEFAULT_FROM_EMAIL,
+                pdf=bytes(self.attachment_content) if self.attachment_content else None,
+                pdf_name=self.attachment_name or None,
+            )
+        except Exception as error:
+            self.last_error = errorToString(error)
+            if self.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+                self.status = "FAILED"
+            else:
+                self.next_attempt_at = timezone.now() + timedelta(seconds=self.get_retry_delay())
+            self.save(update_fields=["last_error", "status", "next_attempt_at"])
+            return False
+        # The recipient could be suppressed since the email was queued
+        self.status = "SENT" if sent else "SUPPRESSED"
+        self.sent_at = timezone.now() if sent else None
+        self.save(update_fields=["status", "sent_at"])
+        return True
+
+    def __str__(self):
+        return "{} to {}: {} ({})".format(
+            self.created_at.strftime(dateFormat) if self.created_at else "New",
+            self.recipient,
+            self.subject[:50],
+            self.get_status_display(),
+        )
+
+
+class EmailSuppression(Model):
+    """
+    An address the emails shouldn't be sent to (it bounces, blocks them or reported them as spam), as reported by the
+    SendGrid event webhook. The emails to these addresses are skipped.
+    """
+
+    REASONS = [
+        ("BOUNCE", "Bounce"),
+        ("BLOCKED", "Blocked"),
+        ("SPAMREPORT", "Spam report"),
+    ]
+
+    email = models.EmailField(unique=True)  # Lower case
+    reason = models.TextField(choices=REASONS)
+    details = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def get_suppressed(cls, addresses: Iterable[str]) -> set[str]:
+        """The suppressed ones of the addresses (in lower case), with one query"""
+        addresses = {normalize_address(address) for address in addresses if address}
+        if not addresses:
+            return set()
+        return set(cls.objects.filter(email__in=addresses).values_list("email", flat=True))
+
+    @staticmethod
+    def get_event_reason(event: dict) -> str | None:
+        """The suppression reason for the SendGrid webhook event, if it's the one causing a suppression"""
+        if event.get("event") == "spamreport":
+            return "SPAMREPORT"
+        if event.get("event") == "bounce":
+            return "BLOCKED" if event.get("type") == "blocked" else "BOUNCE"
+        return None
+
+    @classmethod
+    def add_from_events(cls, events: list[dict]) -> int:
+        """Add (or update) the suppressions for the webhook events in one query, return their number"""
+        suppressions = {}
+        for event in events:
+            reason = cls.get_event_reason(event)
+            if reason and event.get("email"):
+                email = normalize_address(event["email"])
+                suppressions[email] = cls(email=email, reason=reason, details=str(event.get("reason") or ""))
+        if suppressions:
+            cls.objects.bulk_create(
+                suppressions.values(),
+                update_conflicts=True,
+                unique_fields=["email"],
+                update_fields=["reason", "details", "updated_at"],
+            )
+        return len(suppressions)
+
+    def __str__(self):
+        return f"{self.email} ({self.get_reason_display()})"
+
+
+class SlackNotification(Model):
+    """
+    A payment notification waiting to be posted to Slack. The `send_slack_digests` worker posts all the pending ones
+    as one digest message every `SLACK_DIGEST_INTERVAL` seconds, so a burst of payments (like the invoices marked paid
+    together in the admin) doesn't make a request (nor a message) per payment.
+    """
+
+    payment = models.ForeignKey(Payment, on_delete=models.SET_NULL, null=True, blank=True)
+    name = models.TextField()
+    title = models.TextField()  # Event title or "membership"
+    price = models.FloatField()
+    currency = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    @classmethod
+    def add_payment(cls, payment: Payment) -> "SlackNotification":
+        return cls.objects.create(
+            payment=payment,
+            name=payment.data["user"]["name"],
+            title=payment.data["event"]["title"] if payment.data["kind"] == "event" else "membership",
+            price=payment.data["price"],
+            currency=payment.data["currency"],
+        )
+
+    @classmethod
+    def send_digest(cls) -> int:
+        """
+        Post the pending notifications as one message, return their number (0 if there are none, or the post has
+        failed: they're posted with the next digest then).
+
+        The notifications are taken by marking them sent in one conditional update (the ones marked by another worker
+        meanwhile are left to it), and posted with no transaction open, so a slow Slack call doesn't hold the database
+        locks the payments (see `add_payment`) wait for. If the worker dies during the post, the digest is lost rather
+        than posted twice.
+        """
+        pending_ids = list(cls.objects.filter(sent_at__isnull=True).order_by("id").values_list("id", flat=True))
+        if not pending_ids:
+            return 0
+        sent_at = timezone.now()
+        cls.objects.filter(id__in=pending_ids, sent_at__isnull=True).update(sent_at=sent_at)
+        pending = list(cls.objects.filter(id__in=pending_ids, sent_at=sent_at).order_by("id"))
+        if not pending:
+            return 0
+        pending_ids = [item.id for item in pending]
+        digest = get_payments_digest(
+            [dict(name=item.name, currency=item.currency, price=item.price, title=item.title) for item in pending]
+        )
+        try:
+            post_slack_message(digest)
+        except requests.RequestException as error:
+            LOG.warning("Slack digest of %d payment(s) failed: %s", len(pending), errorToString(error))
+            cls.objects.filter(id__in=pending_ids).update(sent_at=None)
+            return 0
+        return len(pending)
+
+    def __str__(self):
+        return "{}: {} for {} ({})".format(
+            self.created_at.strftime(dateFormat) if self.created_at else "New",
+            self.name,
+            self.title,
+            "sent" if self.sent_at else "pending",
+        )
+
+
+class StripeEvent(Model):
+    """
+    A received Stripe webhook event. The webhook only stores the event (once per event id, the redelivered ones are
+    ignored), it's processed by the `process_stripe_events` worker, and the failed processing is retried with a
+    growing delay.
+    """
+
+    STATUS = [
+        ("PENDING", "Pending"),
+        ("PROCESSED", "Processed"),
+        ("FAILED", "Failed"),  # Gave up after `STRIPE_EVENT_MAX_ATTEMPTS`
+    ]
+    # The event types stored by the webhook (the other ones are acknowledged and dropped)
+    HANDLED_TYPES = ("payment_intent.succeeded",)
+
+    event_id = models.TextField(unique=True)
+    type = models.TextField()
+    data = models.JSONField(default=dict)  # The event object (like the payment intent)
+    status = models.TextField(choices=STATUS, default="PENDING")
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="stripe_event_due"),
+        ]
+
+    @classmethod
+    def receive(cls, event: dict) -> bool:
+        """Store the webhook event if it's handled and new, return True if it's stored"""
+        if event["type"] not in cls.HANDLED_TYPES:
+            return False
+        _, created = cls.objects.get_or_create(
+            event_id=event["id"], defaults=dict(type=event["type"], data=event["data"]["object"])
+        )
+        return created
+
+    @classmethod
+    def receive_returned_intent(cls, intent: dict) -> "StripeEvent":
+        """
+        Store the succeeded payment intent the customer has returned with (see `payment_stripe_success`) as an event of
+        its own (once per intent), for the payments the webhook hasn't completed (yet, or at all if it's not set up).
+        It's processed like the webhook events, so the payment is completed once whichever comes first.
+        """
+        event, _ = cls.objects.get_or_create(
+            event_id=f"return-{intent['id']}", defaults=dict(type="payment_intent.succeeded", data=intent)
+        )
+        return event
+
+    @classmethod
+    def get_due(cls) -> QuerySet:
+        return cls.objects.filter(status="PENDING", next_attempt_at__lte=timezone.now()).order_by(
+            "next_attempt_at", "id"
+        )
+
+    @classmethod
+    def claim_next(cls) -> "StripeEvent | None":
+        """Take the next due event to process (see `claim`), if any"""
+        for event in cls.get_due()[:claim_candidates]:
+            if event.claim():
+                return event
+        return None
+
+    def claim(self) -> bool:
+        """
+        Claim the due event for processing in the same way as `OutboxEmail.claim`: the attempt is counted and the next
+        one is put off by `STRIPE_EVENT_CLAIM_TIMEOUT` in one conditional update. Return False if it's been claimed by
+        another worker since it's read.
+        """
+        now = timezone.now()
+        next_attempt_at = now + timedelta(seconds=settings.STRIPE_EVENT_CLAIM_TIMEOUT)
+        claimed = StripeEvent.objects.filter(
+            id=self.id, status="PENDING", attempts=self.attempts, next_attempt_at__lte=now
+        ).update(attempts=F("attempts") + 1, next_attempt_at=next_attempt_at)
+        if claimed:
+            self.attempts += 1
+            self.next_attempt_at = next_attempt_at
+        return bool(claimed)
+
+    def get_retry_delay(self) -> float:
+        """Seconds before the next attempt: doubled after every failure, up to the max delay"""
+        delay = settings.STRIPE_EVENT_RETRY_DELAY * 2 ** max(0, self.attempts - 1)
+        return min(delay, settings.STRIPE_EVENT_MAX_RETRY_DELAY)
+
+    def handle_payment_intent_succeeded(self):
+        payment_id = self.data.get("metadata", {}).get("payment_id")
+        if not payment_id:
+            LOG.info("Stripe payment intent %s without payment id ignored", self.data.get("id"))
+            return
+        payment = Payment.objects.select_for_update().get(id=payment_id)
+        if payment.status == "PAID":
+            # Completed already (the same intent can't be paid twice, but a payment could have several of them)
+            return
+        if payment.status != "CREATED":
+            LOG.warning(
+                "Stripe payment intent %s succeeded for %s payment %s", self.data.get("id"), payment.status, payment.id
+            )
+            return
+        mismatch = self.get_charge_mismatch(payment)
+        if mismatch:
+            # Left for a manual check: the event is shown in the admin with the error
+            self.last_error = mismatch
+            LOG.error(
+                "Stripe payment intent %s not applied to payment %s: %s", self.data.get("id"), payment.id, mismatch
+            )
+            return
+        payment.complete_stripe_payment()
+
+    def get_charge_mismatch(self, payment: Payment) -> str | None:
+        """
+        Compare the received amount and currency of the payment intent with the charge the payment expects, return the
+        difference description (None if they match).
+        """
+        from .views.helpers.stripe_amounts import get_stripe_basic_unit
+        from .views.helpers.stripe_payments import get_stripe_charge
+
+        currency = payment.data["currency"]
+        expected = payment.data.get("stripe_charge_in_progress")
+        expected_amount = get_stripe_basic_unit(expected, currency) if expected else get_stripe_charge(payment.data)[0]
+        received_currency = str(self.data.get("currency", "")).upper()
+        received_amount = self.data.get("amount_received")
+        if received_currency != currency or received_amount != expected_amount:
+            return f"Received {received_amount} {received_currency}, expected {expected_amount} {currency}"
+        return None
+
+    def process(self) -> bool:
+        """
+        Handle the claimed event (see `claim_next`) in one transaction with its effects, record the result. Return
+        False if it's failed.
+        """
+        try:
+            with transaction.atomic():
+                getattr(self, "handle_" + self.type.replace(".", "_"))()
+        except Exception as error:
+            LOG.exception("Stripe event %s processing failed", self.event_id)
+            self.last_error = errorToString(error)
+            if self.attempts >= settings.STRIPE_EVENT_MAX_ATTEMPTS:
+                self.status = "FAILED"
+            else:
+                self.next_attempt_at = timezone.now() + timedelta(seconds=self.get_retry_delay())
+            self.save(update_fields=["last_error", "status", "next_attempt_at"])
+            return False
+        self.status = "PROCESSED"
+        self.processed_at = timezone.now()
+        # The handler may leave a note (like the rejected charge) in the error
+        self.save(update_fields=["status", "processed_at", "last_error"])
+        return True
+
+    def __str__(self):
+        return "{} {} ({})".format(self.type, self.event_id, self.get_status_display())
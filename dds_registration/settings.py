@@ -28,12 +28,18 @@ env = environ.Env(
     DEBUG=(bool, False),  # Django debug mode
     SECRET_KEY=(str, ""),
     SENDGRID_API_KEY=(str, ""),
+    SENDGRID_WEBHOOK_PUBLIC_KEY=(str, ""),
+    SENDGRID_API_HOST=(str, "https://api.sendgrid.com"),
+    EMAIL_TRANSPORT=(str, "dds_registration.core.helpers.email.SendGridTransport"),
     REGISTRATION_SALT=(str, ""),
     DEFAULT_FROM_EMAIL=(str, "events@d-d-s.ch"),
     STRIPE_PUBLISHABLE_KEY=(str, ""),
     STRIPE_SECRET_KEY=(str, ""),
+    STRIPE_WEBHOOK_SECRET=(str, ""),
     SLACK_WEBHOOK=(str, ""),
     SENTRY_DSN=(str, ""),
+    DOCUMENTS_SERVE_MODE=(str, ""),
+    DOCUMENT_EMAIL_MODE=(str, "attachment"),
 )
 
 environ.Env.read_env(os.path.join(BASE_DIR, ".env"))
@@ -57,8 +63,13 @@ USE_DJANGO_PREPROCESSORS = False  # LOCAL
 SECRET_KEY = env("SECRET_KEY")
 REGISTRATION_SALT = env("REGISTRATION_SALT")
 SENDGRID_API_KEY = env("SENDGRID_API_KEY")
+# The verification key of the signed event webhook (SendGrid mail settings); the webhook is disabled without it
+SENDGRID_WEBHOOK_PUBLIC_KEY = env("SENDGRID_WEBHOOK_PUBLIC_KEY")
 STRIPE_PUBLISHABLE_KEY = env("STRIPE_PUBLISHABLE_KEY")
 STRIPE_SECRET_KEY = env("STRIPE_SECRET_KEY")
+# The signing secret of the Stripe webhook endpoint (see deployment.md); the webhook is disabled without it, and the
+# card payments are only completed when the customers return from Stripe (see `payment_stripe_success`)
+STRIPE_WEBHOOK_SECRET = env("STRIPE_WEBHOOK_SECRET")
 SLACK_WEBHOOK = env("SLACK_WEBHOOK")
 SENTRY_DSN = env("SENTRY_DSN")
 
@@ -91,6 +102,43 @@ MEDIA_FOLDER = "media/"
 MEDIA_ROOT = posixpath.join(BASE_DIR, MEDIA_FOLDER)
 MEDIA_URL = posixpath.join("/", MEDIA_FOLDER)
 
+# Rendered invoices and receipts (private: shouldn't be served directly by the web server)
+DOCUMENTS_FOLDER = "documents/"
+DOCUMENTS_ROOT = posixpath.join(BASE_DIR, DOCUMENTS_FOLDER)
+# How the stored documents and exports are sent (after the access check): by django (empty), by nginx
+# ("x-accel-redirect", from the internal location below, aliased to `DOCUMENTS_ROOT`) or by apache/lighttpd
+# ("x-sendfile")
+DOCUMENTS_SERVE_MODE = env("DOCUMENTS_SERVE_MODE")
+DOCUMENTS_ACCEL_LOCATION = "/protected/documents/"
+
+# How the invoices and receipts are emailed: attached ("attachment") or as the signed download links ("link"), valid
+# for `DOCUMENT_LINK_MAX_AGE` seconds
+DOCUMENT_EMAIL_MODE = env("DOCUMENT_EMAIL_MODE")
+DOCUMENT_LINK_MAX_AGE = 60 * 24 * 60 * 60
+
+# Worker processes for the batch documents rendering in the management commands (0: the number of CPUs)
+PDF_RENDER_WORKERS = 0
+
+# The pdf downloads rendering a document (instead of sending the stored one) are limited per user and document kind:
+# a burst of `PDF_RENDER_RATE_BURST` renders, then one render every `PDF_RENDER_RATE_SECONDS`
+PDF_RENDER_RATE_BURST = 5
+PDF_RENDER_RATE_SECONDS = 10
+# Concurrent pdf renders of the downloads (counted in the cache, so the limits are approximate, see `throttling`)
+PDF_RENDER_CONCURRENCY = 2
+
+# The cache is shared by all the app processes (the uWSGI workers, the worker commands), so the limits above
+# (approximately) and the cached previews and Stripe client secrets are common to them. It's kept in files (private, like the documents), to
+# keep the writes away from the database.
+CACHE_FOLDER = "cache/"
+CACHE_ROOT = posixpath.join(BASE_DIR, CACHE_FOLDER)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": CACHE_ROOT,
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+
 # The folder for asset file sources
 SRC_FOLDER = "src"
 SRC_ROOT = posixpath.join(BASE_DIR, SRC_FOLDER)
@@ -262,6 +310,46 @@ EMAIL_USE_TLS = True
 # @see https://docs.sendgrid.com/for-developers/sending-email/django
 EMAIL_HOST_PASSWORD = SENDGRID_API_KEY
 
+# The payment notifications are posted to the `SLACK_WEBHOOK` by the `send_slack_digests` worker, combined into one
+# message every `SLACK_DIGEST_INTERVAL` seconds
+SLACK_DIGEST_INTERVAL = 60
+
+# Outbound HTTP calls to the third party services (see `core/helpers/http.py`): the (connect, read) timeouts in
+# seconds, the max concurrent calls per process (also the connection pool size) and the seconds to wait for a free slot
+OUTBOUND_HTTP = {
+    "stripe": {"timeout": (3.05, 20), "concurrency": 8, "wait": 10},
+    "sendgrid": {"timeout": (3.05, 30), "concurrency": 4, "wait": 30},
+    "slack": {"timeout": (3.05, 5), "concurrency": 2, "wait": 5},
+}
+
+# The class sending the emails (see `core/helpers/email.py`): `SendGridTransport`, or `MemoryTransport` to keep them in
+# memory. The SendGrid API host can be changed to a local stand-in server, see `benchmarks/fake_sendgrid.py`
+EMAIL_TRANSPORT = env("EMAIL_TRANSPORT")
+SENDGRID_API_HOST = env("SENDGRID_API_HOST")
+
+# The emails are put to the outbox and sent by the `send_outbox_emails` worker. A failed send is retried after
+# `EMAIL_OUTBOX_RETRY_DELAY` seconds, doubling the delay every time (up to the max), at most
+# `EMAIL_OUTBOX_MAX_ATTEMPTS` times. An email (or a message broadcast batch) taken by a worker is skipped by the others
+# for `EMAIL_OUTBOX_CLAIM_TIMEOUT` seconds (longer than a SendGrid call can take), then it's retried if it's still not
+# sent
+EMAIL_OUTBOX_BATCH_SIZE = 50
+EMAIL_OUTBOX_RETRY_DELAY = 60
+EMAIL_OUTBOX_MAX_RETRY_DELAY = 6 * 60 * 60
+EMAIL_OUTBOX_MAX_ATTEMPTS = 8
+EMAIL_OUTBOX_CLAIM_TIMEOUT = 5 * 60
+
+# The Stripe webhook events are stored and processed by the `process_stripe_events` worker; the failed processing is
+# retried (and the events taken by a worker are skipped by the others) in the same way as the outbox emails
+STRIPE_EVENT_RETRY_DELAY = 30
+STRIPE_EVENT_MAX_RETRY_DELAY = 60 * 60
+STRIPE_EVENT_MAX_ATTEMPTS = 8
+STRIPE_EVENT_CLAIM_TIMEOUT = 5 * 60
+# Max age (seconds) of the signed webhook requests
+STRIPE_WEBHOOK_TOLERANCE = 300
+
+# The SendGrid event webhook requests older than that (seconds) are rejected, as possible replays
+SENDGRID_WEBHOOK_MAX_AGE = 10 * 60
+
 LANGUAGE_CODE = "en-us"
 TIME_ZONE = "UTC"
 USE_I18N = True
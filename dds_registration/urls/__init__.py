@@ -13,5 +13,13 @@ from .event_urls import urlpatterns as event_urlpatterns
 from .membership_urls import urlpatterns as membership_urlpatterns
 from .payments_urls import urlpatterns as payment_urlpatterns
 from .root_urls import urlpatterns as root_urlpatterns
+from .webhook_urls import urlpatterns as webhook_urlpatterns
 
-urlpatterns = accounts_urlpatterns + event_urlpatterns + root_urlpatterns + payment_urlpatterns + membership_urlpatterns
+urlpatterns = (
+    accounts_urlpatterns
+    + event_urlpatterns
+    + root_urlpatterns
+    + payment_urlpatterns
+    + membership_urlpatterns
+    + webhook_urlpatterns
+)
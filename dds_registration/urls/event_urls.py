@@ -4,6 +4,7 @@
 from django.urls import path
 
 from ..views import event_registration as event_registration_views
+from ..views.event_checkin import event_checkin
 
 urlpatterns = [
     path(
@@ -11,6 +12,11 @@ urlpatterns = [
         event_registration_views.event_registration,
         name="event_registration",
     ),
+    path(
+        "event/<str:event_code>/checkin",
+        event_checkin,
+        name="event_checkin",
+    ),
     # path(
     #     "event/<str:event_code>/registration/cancel",
     #     event_registration_views.event_registration_cancel_confirm,
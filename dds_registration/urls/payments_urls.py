@@ -1,7 +1,7 @@
 from django.urls import path
 
-from ..views.billing_stripe import payment_stripe, payment_stripe_success
-from ..views.payment_utils import invoice_download, receipt_download
+from ..views.billing_stripe import payment_stripe, payment_stripe_client_secret, payment_stripe_success
+from ..views.payment_utils import document_link_download, invoice_download, receipt_download
 
 urlpatterns = [
     path(
@@ -14,11 +14,21 @@ urlpatterns = [
         receipt_download,
         name="receipt_download",
     ),
+    path(
+        "payments/<int:payment_id>/document/<str:kind>/<str:token>",
+        document_link_download,
+        name="document_link_download",
+    ),
     path(
         "payments/<int:payment_id>/stripe",
         payment_stripe,
         name="payment_stripe",
     ),
+    path(
+        "payments/<int:payment_id>/stripe/client-secret",
+        payment_stripe_client_secret,
+        name="payment_stripe_client_secret",
+    ),
     path(
         "payments/<int:payment_id>/stripe/success",
         payment_stripe_success,
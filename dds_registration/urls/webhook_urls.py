@@ -0,0 +1,16 @@
+from django.urls import path
+
+from ..views.webhooks import sendgrid_events, stripe_events
+
+urlpatterns = [
+    path(
+        "webhooks/sendgrid/events",
+        sendgrid_events,
+        name="sendgrid_events",
+    ),
+    path(
+        "webhooks/stripe/events",
+        stripe_events,
+        name="stripe_events",
+    ),
+]
@@ -1,16 +1,25 @@
+import logging
+
+import requests
+import stripe
+from asgiref.sync import sync_to_async
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.sites.shortcuts import get_current_site
 from django.core.exceptions import ObjectDoesNotExist
-from django.http import Http404, HttpRequest
+from django.http import Http404, HttpRequest, JsonResponse
 from django.shortcuts import redirect, render
-
-from ..models import Membership, Payment, Registration
-from .helpers.stripe_amounts import (
-    convert_from_stripe_units,
-    get_stripe_amount_for_currency,
+from django.views.decorators.http import require_POST
+
+from ..models import Membership, Payment
+from .helpers.stripe_payments import (
+    PaymentInProgress,
+    complete_returned_payment,
+    get_payment_client_secret,
+    get_stripe_charge,
 )
-from .helpers.stripe_payments import get_stripe_client_secret
+
+LOG = logging.getLogger(__name__)
 
 
 @login_required
@@ -28,22 +37,8 @@ def payment_stripe(request: HttpRequest, payment_id: int):
         messages.error(request, "Can't pay for someone else's items")
         return redirect("profile")
 
-    # Stripe is in cents or centimes
-    stripe_amount = get_stripe_amount_for_currency(
-        amount=payment.data["price"],
-        currency=payment.data["currency"],
-    )
-    actual_amount = convert_from_stripe_units(
-        amount=stripe_amount,
-        currency=payment.data["currency"],
-    )
-
-    payment.data["stripe_charge_in_progress"] = actual_amount
-    payment.save()
-
-    stripe_intent = get_stripe_client_secret(
-        payment.data["currency"], stripe_amount, request.user.email, {"payment_id": payment.id}
-    )
+    # The payment intent is created (and the charged amount is stored) by the client secret request of the page
+    _, actual_amount = get_stripe_charge(payment.data)
 
     template = "dds_registration/billing/stripe_payment.html.django"
 
@@ -56,7 +51,7 @@ def payment_stripe(request: HttpRequest, payment_id: int):
         request=request,
         template_name=template,
         context={
-            "client_secret": stripe_intent.client_secret,
+            "charge_amount": actual_amount,
             "payment": payment,
             "year": membership.until if membership else "",
             "site": get_current_site(request),
@@ -65,30 +60,75 @@ def payment_stripe(request: HttpRequest, payment_id: int):
     )
 
 
+@require_POST
+async def payment_stripe_client_secret(request: HttpRequest, payment_id: int) -> JsonResponse:
+    """
+    The client secret of the payment intent, requested by the payment page once it's rendered. The view is async: under
+    ASGI the Stripe call runs in a worker thread without holding the event loop.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({"error": "Please log in to pay"}, status=401)
+    try:
+        payment = await Payment.objects.aget(id=payment_id)
+    except ObjectDoesNotExist:
+        return JsonResponse({"error": "Payment not found"}, status=404)
+    if payment.status != "CREATED":
+        return JsonResponse({"error": "This payment has already been paid or refunded"}, status=409)
+    if payment.data["user"]["id"] != user.id:
+        return JsonResponse({"error": "Can't pay for someone else's items"}, status=403)
+    stripe_amount, actual_amount = get_stripe_charge(payment.data)
+    try:
+        # The Stripe calls take up to a couple of seconds
+        intent_id, client_secret = await sync_to_async(get_payment_client_secret, thread_sensitive=False)(
+            payment.id, payment.data.get("stripe_intent_id"), payment.data["currency"], stripe_amount, user.email
+        )
+    except PaymentInProgress:
+        return JsonResponse({"error": "This payment is already being processed"}, status=409)
+    except (stripe.StripeError, requests.RequestException) as error:
+        LOG.warning("Stripe payment intent for payment %s failed: %s", payment.id, error)
+        return JsonResponse({"error": "The payment service is not available, please try again later"}, status=502)
+    if (
+        payment.data.get("stripe_intent_id") != intent_id
+        or payment.data.get("stripe_charge_in_progress") != actual_amount
+    ):
+        payment.data["stripe_intent_id"] = intent_id
+        payment.data["stripe_charge_in_progress"] = actual_amount
+        # Only the data, and only if the payment hasn't been completed (see `StripeEvent`) during the Stripe calls
+        updated = await Payment.objects.filter(id=payment.id, status="CREATED").aupdate(data=payment.data)
+        if not updated:
+            return JsonResponse({"error": "This payment has already been paid or refunded"}, status=409)
+    return JsonResponse({"client_secret": client_secret})
+
+
 @login_required
 def payment_stripe_success(request: HttpRequest, payment_id: int):
+    """
+    The return page of the Stripe payment. The payment is completed by the Stripe webhook event (see `StripeEvent`),
+    which usually arrives before the customer is redirected here; otherwise its payment intent is checked with Stripe
+    (see `complete_returned_payment`).
+    """
     try:
         payment = Payment.objects.get(id=payment_id)
     except ObjectDoesNotExist:
         raise Http404
 
-    if payment.status != "CREATED":
-        messages.error(request, "This payment has already been paid or refunded")
-        return redirect("profile")
-
     if payment.data["user"]["id"] != request.user.id:
         messages.error(request, "Can't pay for someone else's items")
         return redirect("profile")
 
-    payment.data["price"] = payment.data.pop("stripe_charge_in_progress")
-    payment.mark_paid()
-
-    if payment.data["kind"] == "membership":
+    payment = complete_returned_payment(payment)
+    if payment.status == "CREATED":
+        messages.info(
+            request,
+            "Thanks! Your payment is being processed, you will receive the receipt by email once it's confirmed.",
+        )
+    elif payment.status != "PAID":
+        messages.error(request, "This payment has already been paid or refunded")
+    elif payment.data["kind"] == "membership":
         messages.success(request, "Awesome, your membership is paid, and you are good to go!")
     else:
         messages.success(
             request, f"Awesome, your registration for {payment.data['event']['title']} is paid, and you are good to go!"
         )
-        reg = Registration.objects.get(id=payment.data["registration"]["id"])
-        reg.complete_registration()
     return redirect("profile")
@@ -0,0 +1,47 @@
+from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import Http404, HttpRequest
+from django.shortcuts import redirect, render
+
+from ..models import Event, Registration
+
+
+@staff_member_required
+def event_checkin(request: HttpRequest, event_code: str):
+    """
+    Check the attendees in at the event door by the codes printed on their badges (and on the check-in sheet). The
+    code lookup uses the unique index of the column, so it doesn't depend on the number of the registrations.
+    """
+    try:
+        event = Event.objects.get(code=event_code)
+    except ObjectDoesNotExist:
+        raise Http404
+
+    if request.method == "POST":
+        code = request.POST.get("code", "")
+        try:
+            registration = Registration.get_by_checkin_code(event, code)
+        except ObjectDoesNotExist:
+            messages.error(request, f"No {event.title} registration with the code {code.strip()}")
+        else:
+            name = registration.user.get_full_name() or registration.user.email
+            if registration.status != "REGISTERED":
+                messages.error(request, f"{name}: the registration is {registration.get_status_display().lower()}")
+            elif registration.check_in():
+                option = f" ({registration.option.item})" if registration.option else ""
+                messages.success(request, f"{name}{option} checked in")
+            else:
+                messages.warning(request, f"{name} has already checked in at {registration.checked_in_at:%H:%M}")
+        return redirect("event_checkin", event_code=event.code)
+
+    registered = event.registrations.filter(status="REGISTERED")
+    return render(
+        request,
+        "dds_registration/event/event_checkin.html.django",
+        {
+            "event": event,
+            "registered_count": registered.count(),
+            "checked_in_count": registered.filter(checked_in_at__isnull=False).count(),
+        },
+    )
@@ -1,4 +1,37 @@
+import logging
+
+import requests
 import stripe
+from django.core.cache import cache
+
+from ...models import Payment, StripeEvent
+from .stripe_amounts import convert_from_stripe_units, get_stripe_amount_for_currency
+
+# The payment intent statuses before the payment is submitted: such an intent is reused by the next page visits
+# @see https://docs.stripe.com/payments/paymentintents/lifecycle
+reusable_intent_statuses = ("requires_payment_method", "requires_confirmation", "requires_action")
+
+# The client secrets are cached (per payment, intent and amount) to skip the intent retrieval on the page reloads
+client_secret_cache_timeout = 10 * 60
+
+LOG = logging.getLogger(__name__)
+
+
+class PaymentInProgress(Exception):
+    """The payment intent is already submitted (processing or succeeded), a new one shouldn't be created"""
+
+
+def get_stripe_charge(payment_data: dict) -> tuple[int, float]:
+    """The amount to charge (with the Stripe fees) for the payment: in the Stripe units (cents or centimes) and actual"""
+    stripe_amount = get_stripe_amount_for_currency(
+        amount=payment_data["price"],
+        currency=payment_data["currency"],
+    )
+    actual_amount = convert_from_stripe_units(
+        amount=stripe_amount,
+        currency=payment_data["currency"],
+    )
+    return stripe_amount, actual_amount
 
 
 def get_stripe_client_secret(
@@ -7,7 +40,8 @@ def get_stripe_client_secret(
     email: str,
     optional_metadata: dict = {},
 ):
-    # TODO: Probably it'd be better to use old approach: to start payment and to fetch the secret via async ajax request: this operation requires a noticeable time (up to 1-2 seconds required to open the page)
+    # The intent is created by the client secret request of the payment page (see `get_payment_client_secret`), so
+    # the page is rendered without waiting for Stripe
     # @see https://docs.stripe.com/api/metadata
     # @see https://docs.stripe.com/api/payment_intents/create
     intent = stripe.PaymentIntent.create(
@@ -18,3 +52,68 @@ def get_stripe_client_secret(
         receipt_email=email,
     )
     return intent
+
+
+def get_reusable_intent(intent_id: str, currency: str, price: int):
+    """
+    The stored payment intent, updated to the amount (and currency) if it's changed, or None if it can't be reused.
+    Raise `PaymentInProgress` if it's already submitted.
+    """
+    try:
+        intent = stripe.PaymentIntent.retrieve(intent_id)
+    except stripe.InvalidRequestError:
+        return None
+    if intent.status in ("processing", "requires_capture", "succeeded"):
+        raise PaymentInProgress(f"Payment intent {intent_id} is {intent.status}")
+    if intent.status not in reusable_intent_statuses:
+        return None
+    if intent.amount != price or intent.currency.lower() != currency.lower():
+        intent = stripe.PaymentIntent.modify(intent_id, amount=price, currency=currency.lower())
+    return intent
+
+
+def get_payment_client_secret(
+    payment_id: int, intent_id: str | None, currency: str, price: int, email: str
+) -> tuple[str, str]:
+    """
+    The payment intent id and client secret for the payment page: of the intent stored for the payment (see
+    `get_reusable_intent`), or of a new one. The page reloads don't create the abandoned intents, and mostly don't
+    call Stripe at all.
+    """
+    if intent_id:
+        client_secret = cache.get(f"stripe-client-secret:{payment_id}:{intent_id}:{currency}:{price}")
+        if client_secret:
+            return intent_id, client_secret
+    intent = get_reusable_intent(intent_id, currency, price) if intent_id else None
+    if intent is None:
+        intent = get_stripe_client_secret(currency, price, email, {"payment_id": payment_id})
+    cache.set(
+        f"stripe-client-secret:{payment_id}:{intent.id}:{currency}:{price}",
+        intent.client_secret,
+        client_secret_cache_timeout,
+    )
+    return intent.id, intent.client_secret
+
+
+def complete_returned_payment(payment: Payment) -> Payment:
+    """
+    Complete the payment the customer has returned from Stripe with, if its payment intent has succeeded and the
+    webhook event hasn't completed it yet: the intent is processed at once as a Stripe event (see
+    `StripeEvent.receive_returned_intent`). Return the payment in its current state.
+    """
+    intent_id = payment.data.get("stripe_intent_id")
+    if payment.status != "CREATED" or not intent_id:
+        return payment
+    try:
+        intent = stripe.PaymentIntent.retrieve(intent_id)
+    except (stripe.StripeError, requests.RequestException) as error:
+        # Left to the webhook
+        LOG.warning("Stripe payment intent %s of payment %s retrieval failed: %s", intent_id, payment.id, error)
+        return payment
+    if intent.status != "succeeded":
+        return payment
+    event = StripeEvent.receive_returned_intent(intent.to_dict())
+    if event.claim():
+        event.process()
+    payment.refresh_from_db()
+    return payment
@@ -1,12 +1,74 @@
+from pathlib import Path
+
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
 from django.http import Http404, HttpRequest, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 
+from ..core.helpers.documents import check_document_link
+from ..core.helpers.file_serving import get_file_response
+from ..core.helpers.throttling import Throttled, check_rate, concurrency_slot
 from ..models import Payment
 
 
-@login_required
-def invoice_download(request: HttpRequest, payment_id: int) -> HttpResponse:
+def get_throttled_document_file(payment: Payment, kind: str, rate_key: str) -> Path:
+    """
+    Path of the stored document. If it has to be rendered, the renders are rate limited per the key (the user) and
+    document kind, and capped globally (raises `Throttled`).
+    """
+    path = payment.document_path(kind)
+    if path.exists():
+        return path
+    check_rate(f"pdf-render:{rate_key}:{kind}", settings.PDF_RENDER_RATE_BURST, settings.PDF_RENDER_RATE_SECONDS)
+    with concurrency_slot("pdf-render", settings.PDF_RENDER_CONCURRENCY):
+        return payment.get_document_file(kind)
+
+
+def get_file_mtime(path: Path) -> int | None:
+    """The file modification time (in whole seconds, as the http dates), if it exists"""
+    try:
+        return int(path.stat().st_mtime)
+    except FileNotFoundError:
+        return None
+
+
+def get_document_response(request: HttpRequest, payment: Payment, kind: str, rate_key: str) -> HttpResponse:
+    """
+    Send the payment document (invoice or receipt), the access must be checked by the caller.
+
+    The document version (a hash of the payment data it's rendered from) is used as the ETag, so the browser can
+    revalidate its private copy and get a 304 instead of the whole document. The Last-Modified is the time the stored
+    file was written: every document version is stored in its own file, so it changes with the document (unlike the
+    payment update date, which has a day precision).
+
+    If the document has to be rendered but the renders are throttled, a 429 with Retry-After is sent: an outdated
+    copy (like an invoice with the old price or address) is never sent instead.
+    """
+    filename = f"DdS {kind} {payment.invoice_no}.pdf"
+    etag = quote_etag(payment.document_version(kind))
+    # Not known until the document is stored
+    last_modified = get_file_mtime(payment.document_path(kind))
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        try:
+            path = get_throttled_document_file(payment, kind, rate_key)
+        except Throttled as error:
+            response = HttpResponse("Too many document requests, please retry later", status=429)
+            response["Retry-After"] = error.retry_after_header
+            return response
+        last_modified = get_file_mtime(path)
+        response = get_file_response(path, filename, "application/pdf")
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def document_download(request: HttpRequest, payment_id: int, kind: str) -> HttpResponse:
+    """Send the payment document to its owner"""
     try:
         payment = Payment.objects.get(id=payment_id)
     except ObjectDoesNotExist:
@@ -15,21 +77,31 @@ def invoice_download(request: HttpRequest, payment_id: int) -> HttpResponse:
     if payment.data["user"]["id"] != request.user.id:
         raise PermissionDenied()
 
-    response = HttpResponse(content=bytes(payment.invoice_pdf().output()), content_type="application/pdf")
-    response["Content-Disposition"] = f'attachment; filename="DdS invoice {payment.invoice_no}.pdf"'
-    return response
+    return get_document_response(request, payment, kind, rate_key=f"user-{request.user.id}")
 
 
-@login_required
-def receipt_download(request: HttpRequest, payment_id: int) -> HttpResponse:
+def document_link_download(request: HttpRequest, payment_id: int, kind: str, token: str) -> HttpResponse:
+    """
+    Send the payment document by the signed link from the email (see `Payment.get_document_link`): the link is checked
+    by its signature and age only, no login is required. The document is rendered on the first download.
+    """
+    if kind not in Payment.DOCUMENT_KINDS:
+        raise Http404
+    if not check_document_link(payment_id, kind, token):
+        raise PermissionDenied("The document link is invalid or expired")
     try:
         payment = Payment.objects.get(id=payment_id)
     except ObjectDoesNotExist:
         raise Http404
 
-    if payment.data["user"]["id"] != request.user.id:
-        raise PermissionDenied()
+    return get_document_response(request, payment, kind, rate_key=f"payment-{payment.id}")
 
-    response = HttpResponse(content=bytes(payment.receipt_pdf().output()), content_type="application/pdf")
-    response["Content-Disposition"] = f'attachment; filename="DdS receipt {payment.invoice_no}.pdf"'
-    return response
+
+@login_required
+def invoice_download(request: HttpRequest, payment_id: int) -> HttpResponse:
+    return document_download(request, payment_id, "invoice")
+
+
+@login_required
+def receipt_download(request: HttpRequest, payment_id: int) -> HttpResponse:
+    return document_download(request, payment_id, "receipt")
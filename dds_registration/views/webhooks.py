@@ -0,0 +1,69 @@
+import json
+import logging
+
+import stripe
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from sendgrid.helpers.eventwebhook import EventWebhookHeader
+
+from ..core.helpers.email import verify_event_webhook
+from ..models import EmailSuppression, StripeEvent
+
+LOG = logging.getLogger(__name__)
+
+
+@csrf_exempt
+@require_POST
+def sendgrid_events(request: HttpRequest) -> HttpResponse:
+    """
+    The SendGrid (signed) event webhook: the bounces, blocks and spam reports are added to the suppression list.
+    """
+    if not verify_event_webhook(
+        request.body,
+        request.headers.get(EventWebhookHeader.SIGNATURE, ""),
+        request.headers.get(EventWebhookHeader.TIMESTAMP, ""),
+    ):
+        LOG.warning("SendGrid event webhook request with invalid signature")
+        return HttpResponseForbidden()
+    try:
+        events = json.loads(request.body)
+    except ValueError:
+        return HttpResponseBadRequest()
+    if not isinstance(events, list):
+        return HttpResponseBadRequest()
+    count = EmailSuppression.add_from_events([event for event in events if isinstance(event, dict)])
+    if count:
+        LOG.info("%d address(es) added to the email suppression list", count)
+    return HttpResponse(status=204)
+
+
+@csrf_exempt
+@require_POST
+def stripe_events(request: HttpRequest) -> HttpResponse:
+    """
+    The Stripe webhook: the signed events are only stored here (see `StripeEvent`) and acknowledged at once, they're
+    processed by the `process_stripe_events` worker.
+    """
+    if not settings.STRIPE_WEBHOOK_SECRET:
+        LOG.warning("Stripe webhook request without STRIPE_WEBHOOK_SECRET configured")
+        return HttpResponseForbidden()
+    try:
+        stripe.WebhookSignature.verify_header(
+            request.body.decode("utf-8"),
+            request.headers.get("Stripe-Signature", ""),
+            settings.STRIPE_WEBHOOK_SECRET,
+            settings.STRIPE_WEBHOOK_TOLERANCE,
+        )
+        event = json.loads(request.body)
+    except stripe.SignatureVerificationError:
+        LOG.warning("Stripe webhook request with invalid signature")
+        return HttpResponseForbidden()
+    except ValueError:
+        return HttpResponseBadRequest()
+    if not isinstance(event, dict) or not {"id", "type", "data"} <= event.keys():
+        return HttpResponseBadRequest()
+    if StripeEvent.receive(event):
+        LOG.info("Stripe event %s (%s) received", event["id"], event["type"])
+    return HttpResponse()
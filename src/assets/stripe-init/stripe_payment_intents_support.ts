@@ -1,6 +1,6 @@
 /**
  * @module stripe_payment_intents_support.ts
- * @changed 2024.04.04, 00:21
+ * @changed 2026.10.18, 19:40
  */
 
 import type {
@@ -11,6 +11,14 @@ import type {
   StripePaymentElement,
 } from '@stripe/stripe-js/dist/stripe-js';
 
+/** Show the error message under the form */
+function showError(message: string) {
+  const messageContainer = document.querySelector('#error-message');
+  if (messageContainer) {
+    messageContainer.textContent = message;
+  }
+}
+
 /** Form action */
 function submitStripeForm(
   stripe: Stripe,
@@ -46,10 +54,7 @@ function submitStripeForm(
         );
 
         // Show error
-        const messageContainer = document.querySelector('#error-message');
-        if (messageContainer) {
-          messageContainer.textContent = error.message || '';
-        }
+        showError(error.message || '');
       } else {
         // Success: redirect to success message
         console.log(
@@ -77,13 +82,26 @@ function submitStripeForm(
     });
 }
 
-/** Start stripe payment form */
-export function startStripeElementsForm(params: TCreateCheckoutSessionParams) {
-  const {
-    STRIPE_PUBLISHABLE_KEY,
-    // success_url,
-    client_secret,
-  } = params;
+/** Request the payment intent client secret (the intent is created by the request) */
+function fetchClientSecret(params: TCreateCheckoutSessionParams): Promise<string> {
+  const { client_secret_url, csrf_token } = params;
+  return fetch(client_secret_url, {
+    method: 'POST',
+    credentials: 'same-origin',
+    headers: { Accept: 'application/json', 'X-CSRFToken': csrf_token },
+  })
+    .then((response) => response.json().then((data: TClientSecretResponse) => ({ response, data })))
+    .then(({ response, data }) => {
+      if (!response.ok || !data.client_secret) {
+        throw new Error(data.error || 'The payment form could not be loaded, please try again later');
+      }
+      return data.client_secret;
+    });
+}
+
+/** Create the stripe payment form, for the received client secret */
+function createStripeElementsForm(params: TCreateCheckoutSessionParams, client_secret: string) {
+  const { STRIPE_PUBLISHABLE_KEY } = params;
 
   // Initialize Stripe.js
   const stripe: Stripe = window.Stripe(STRIPE_PUBLISHABLE_KEY);
@@ -98,9 +116,13 @@ export function startStripeElementsForm(params: TCreateCheckoutSessionParams) {
   // Set up Stripe.js and Elements to use in checkout form, passing the client secret obtained in a previous step
   const elements: StripeElements = stripe.elements(options);
 
-  // Create and mount the Payment Element
+  // Create and mount the Payment Element (it replaces the loading text)
   // @see https://docs.stripe.com/js/elements_object/create_payment_element
   const paymentElement: StripePaymentElement = elements.create('payment');
+  const paymentNode = document.getElementById('payment-element');
+  if (paymentNode) {
+    paymentNode.textContent = '';
+  }
   paymentElement.mount('#payment-element');
 
   const form = document.getElementById('payment-form');
@@ -123,4 +145,25 @@ export function startStripeElementsForm(params: TCreateCheckoutSessionParams) {
   }
 
   form.addEventListener('submit', submitStripeForm.bind(null, stripe, params, elements));
+  const submitButton = document.getElementById('submit') as HTMLInputElement | null;
+  if (submitButton) {
+    submitButton.disabled = false;
+  }
+}
+
+/** Start stripe payment form: the page is shown at once, the form is created when the client secret is received */
+export function startStripeElementsForm(params: TCreateCheckoutSessionParams) {
+  fetchClientSecret(params)
+    .then((client_secret) => createStripeElementsForm(params, client_secret))
+    .catch((error) => {
+      console.error('[stripe_payment_intents_support:startStripeElementsForm] error', {
+        error,
+        params,
+      });
+      const paymentNode = document.getElementById('payment-element');
+      if (paymentNode) {
+        paymentNode.textContent = '';
+      }
+      showError(error.message || String(error));
+    });
 }
@@ -9,12 +9,19 @@ define("scripts", ["require", "exports"], function (require, exports) {
 });
 /**
  * @module stripe_payment_intents_support.ts
- * @changed 2024.04.04, 00:21
+ * @changed 2026.10.18, 19:40
  */
 define("stripe-init/stripe_payment_intents_support", ["require", "exports"], function (require, exports) {
     "use strict";
     Object.defineProperty(exports, "__esModule", { value: true });
     exports.startStripeElementsForm = void 0;
+    /** Show the error message under the form */
+    function showError(message) {
+        var messageContainer = document.querySelector('#error-message');
+        if (messageContainer) {
+            messageContainer.textContent = message;
+        }
+    }
     /** Form action */
     function submitStripeForm(stripe, params, elements, event) {
         var success_url = params.success_url;
@@ -38,10 +45,7 @@ define("stripe-init/stripe_payment_intents_support", ["require", "exports"], fun
                     stripe: stripe,
                 });
                 // Show error
-                var messageContainer = document.querySelector('#error-message');
-                if (messageContainer) {
-                    messageContainer.textContent = error.message || '';
-                }
+                showError(error.message || '');
             }
             else {
                 // Success: redirect to success message
@@ -63,11 +67,26 @@ define("stripe-init/stripe_payment_intents_support", ["require", "exports"], fun
             });
         });
     }
-    /** Start stripe payment form */
-    function startStripeElementsForm(params) {
-        var STRIPE_PUBLISHABLE_KEY = params.STRIPE_PUBLISHABLE_KEY, 
-        // success_url,
-        client_secret = params.client_secret;
+    /** Request the payment intent client secret (the intent is created by the request) */
+    function fetchClientSecret(params) {
+        var client_secret_url = params.client_secret_url, csrf_token = params.csrf_token;
+        return fetch(client_secret_url, {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: { Accept: 'application/json', 'X-CSRFToken': csrf_token },
+        })
+            .then(function (response) { return response.json().then(function (data) { return ({ response: response, data: data }); }); })
+            .then(function (_a) {
+            var response = _a.response, data = _a.data;
+            if (!response.ok || !data.client_secret) {
+                throw new Error(data.error || 'The payment form could not be loaded, please try again later');
+            }
+            return data.client_secret;
+        });
+    }
+    /** Create the stripe payment form, for the received client secret */
+    function createStripeElementsForm(params, client_secret) {
+        var STRIPE_PUBLISHABLE_KEY = params.STRIPE_PUBLISHABLE_KEY;
         // Initialize Stripe.js
         var stripe = window.Stripe(STRIPE_PUBLISHABLE_KEY);
         // @see https://docs.stripe.com/js/elements_object/create_payment_element#payment_element_create-options
@@ -78,9 +97,13 @@ define("stripe-init/stripe_payment_intents_support", ["require", "exports"], fun
         };
         // Set up Stripe.js and Elements to use in checkout form, passing the client secret obtained in a previous step
         var elements = stripe.elements(options);
-        // Create and mount the Payment Element
+        // Create and mount the Payment Element (it replaces the loading text)
         // @see https://docs.stripe.com/js/elements_object/create_payment_element
         var paymentElement = elements.create('payment');
+        var paymentNode = document.getElementById('payment-element');
+        if (paymentNode) {
+            paymentNode.textContent = '';
+        }
         paymentElement.mount('#payment-element');
         var form = document.getElementById('payment-form');
         if (!form) {
@@ -100,6 +123,26 @@ define("stripe-init/stripe_payment_intents_support", ["require", "exports"], fun
             return;
         }
         form.addEventListener('submit', submitStripeForm.bind(null, stripe, params, elements));
+        var submitButton = document.getElementById('submit');
+        if (submitButton) {
+            submitButton.disabled = false;
+        }
+    }
+    /** Start stripe payment form: the page is shown at once, the form is created when the client secret is received */
+    function startStripeElementsForm(params) {
+        fetchClientSecret(params)
+            .then(function (client_secret) { return createStripeElementsForm(params, client_secret); })
+            .catch(function (error) {
+            console.error('[stripe_payment_intents_support:startStripeElementsForm] error', {
+                error: error,
+                params: params,
+            });
+            var paymentNode = document.getElementById('payment-element');
+            if (paymentNode) {
+                paymentNode.textContent = '';
+            }
+            showError(error.message || String(error));
+        });
     }
     exports.startStripeElementsForm = startStripeElementsForm;
 });
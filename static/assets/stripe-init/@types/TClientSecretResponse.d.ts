@@ -0,0 +1,4 @@
+interface TClientSecretResponse {
+  client_secret?: string;
+  error?: string;
+}
@@ -1,5 +1,7 @@
 interface TCreateCheckoutSessionParams {
   STRIPE_PUBLISHABLE_KEY: string;
-  client_secret: string;
+  /** Url of the client secret request (the payment intent is created by it) */
+  client_secret_url: string;
+  csrf_token: string;
   success_url: string;
 }
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+# @module conftest
+# @desc Django setup for the tests: dummy secrets, temporary folders and the test database
+
+import os
+import tempfile
+from datetime import date, timedelta
+
+import pytest
+
+# The missing secrets are filled with dummy values, the emails are kept in memory (see `get_email_transport`)
+test_environment = {
+    "DJANGO_SETTINGS_MODULE": "dds_registration.settings",
+    "SECRET_KEY": "test",
+    "REGISTRATION_SALT": "test",
+    "SENDGRID_API_KEY": "test",
+    "STRIPE_PUBLISHABLE_KEY": "test",
+    "STRIPE_SECRET_KEY": "test",
+    "STRIPE_WEBHOOK_SECRET": "whsec_test",
+    "SENTRY_DSN": "http://test@localhost/1",
+    "EMAIL_TRANSPORT": "dds_registration.core.helpers.email.MemoryTransport",
+}
+for key, value in test_environment.items():
+    os.environ.setdefault(key, value)
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+# Keep the logs, the documents and the cache out of the project folders
+settings.LOGGING = {}
+settings.DOCUMENTS_ROOT = tempfile.mkdtemp(prefix="dds-test-documents-")
+settings.CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+django.setup()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def django_test_database():
+    """The test database (with the migrations applied), for the whole session"""
+    from django.test.runner import DiscoverRunner
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    runner = DiscoverRunner(verbosity=0, interactive=False)
+    old_config = runner.setup_databases()
+    yield
+    runner.teardown_databases(old_config)
+    teardown_test_environment()
+
+
+@pytest.fixture
+def db():
+    """Run the test in a transaction, rolled back at the end (the cache is cleared too)"""
+    from django.core.cache import cache
+    from django.db import transaction
+
+    cache.clear()
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+    cache.clear()
+
+
+@pytest.fixture
+def outbox(db):
+    """The emails sent by the test (as the SendGrid request data)"""
+    from dds_registration.core.helpers.email import get_email_transport
+
+    transport = get_email_transport()
+    transport.outbox.clear()
+    return transport.outbox
+
+
+@pytest.fixture
+def user(db):
+    from dds_registration.models import User
+
+    return User.objects.create(username="ann", email="ann@example.com", first_name="Ann", last_name="Smith")
+
+
+@pytest.fixture
+def make_payment(db, user):
+    """Create an event registration payment (by the bank transfer invoice) of the user"""
+    from dds_registration.models import Event, Payment, Registration, RegistrationOption
+
+    def make_payment(status: str = "CREATED", **data) -> Payment:
+        event = Event.objects.create(
+            title=f"Autumn School {Event.objects.count() + 1}",
+            description="",
+            success_email="Registered",
+            registration_close=date.today() + timedelta(days=10),
+        )
+        option = RegistrationOption.objects.create(event=event, item="Room", price=100, currency="EUR")
+        registration = Registration.objects.create(event=event, user=user, option=option, status="PAYMENT_PENDING")
+        payment = Payment(
+            status=status,
+            data={
+                "user": {"id": user.id, "name": "Ann Smith", "address": "Street 1\nCity"},
+                "extra": "",
+                "kind": "event",
+                "method": "INVOICE",
+                "event": {"id": event.id, "title": event.title},
+                "registration": {"id": registration.id},
+                "option": {"id": option.id, "item": option.item},
+                "price": option.price,
+                "currency": option.currency,
+                **data,
+            },
+        )
+        payment.save()
+        registration.payment = payment
+        registration.save()
+        return payment
+
+    return make_payment
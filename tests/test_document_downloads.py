@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils.http import http_date
+
+
+def download(client: Client, payment, kind: str = "invoice", headers: dict | None = None):
+    return client.get(reverse(f"{kind}_download", args=(payment.id,)), headers=headers)
+
+
+@override_settings(PDF_RENDER_RATE_BURST=1, PDF_RENDER_RATE_SECONDS=60)
+def test_throttled_only_when_rendering(user, make_payment):
+    first, second = make_payment(), make_payment()
+    client = Client()
+    client.force_login(user)
+
+    response = download(client, first)
+    assert response.status_code == 200
+    assert b"".join(response.streaming_content).startswith(b"%PDF")
+
+    # The render burst is used up: the next document to render is refused...
+    response = download(client, second)
+    assert response.status_code == 429
+    assert 1 <= int(response["Retry-After"]) <= 60
+
+    # ...but the stored one is still sent
+    response = download(client, first)
+    assert response.status_code == 200
+
+
+def test_conditional_download(user, make_payment):
+    payment = make_payment()
+    client = Client()
+    client.force_login(user)
+
+    response = download(client, payment)
+    assert response.status_code == 200
+    etag, last_modified = response["ETag"], response["Last-Modified"]
+    assert last_modified == http_date(int(payment.document_path("invoice").stat().st_mtime))
+
+    assert download(client, payment, headers={"If-None-Match": etag}).status_code == 304
+    assert download(client, payment, headers={"If-Modified-Since": last_modified}).status_code == 304
+
+    # A changed document is a new version (and a new file)
+    payment.data["price"] = 120
+    payment.save()
+    response = download(client, payment, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+    assert (
+        download(client, payment, headers={"If-Modified-Since": last_modified, "If-None-Match": etag}).status_code
+        == 200
+    )
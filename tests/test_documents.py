@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from dds_registration.core.helpers.documents import get_payment_documents_folder
+
+
+def issue(payment):
+    payment.status = "ISSUED"
+    payment.save()
+    return payment
+
+
+def test_issued_payment_stores_invoice(make_payment):
+    payment = issue(make_payment())
+    assert payment.document_path("invoice").read_bytes().startswith(b"%PDF")
+    assert not payment.document_path("receipt").exists()
+
+
+def test_paid_payment_stores_receipt(make_payment):
+    payment = issue(make_payment())
+    payment.mark_paid()
+    assert payment.document_path("receipt").read_bytes().startswith(b"%PDF")
+
+
+@pytest.mark.parametrize("status", ["OBSOLETE", "REFUNDED"])
+def test_cancelled_payment_drops_documents(make_payment, status):
+    payment = issue(make_payment())
+    assert payment.document_path("invoice").exists()
+    payment.status = status
+    payment.save()
+    assert not get_payment_documents_folder(payment.id).exists()
+
+
+def test_changed_document_is_rendered_again(make_payment):
+    payment = issue(make_payment())
+    old_path = payment.document_path("invoice")
+    old_content = old_path.read_bytes()
+
+    payment.data["user"]["address"] = "Other street 2\nCity"
+    payment.save()
+    path = payment.document_path("invoice")
+    assert path != old_path
+    assert payment.get_document("invoice") != old_content
+    assert path.exists()
+    assert not old_path.exists()
+    # The stored document is sent from now on
+    assert payment.get_document("invoice") == path.read_bytes()
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+import requests
+
+from dds_registration.core.helpers.http import OutboundService, OutboundStripeClient
+
+
+def respond(request, **kwargs) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response._content = b"{}"
+    response.request = request
+    return response
+
+
+def run_in_threads(target, count: int = 4) -> None:
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_session_per_thread():
+    service = OutboundService("test")
+    sessions = []
+    run_in_threads(lambda: sessions.append(service.session))
+    assert len({id(session) for session in sessions}) == 4
+    assert {id(session.get_adapter("https://api.stripe.com")) for session in sessions} == {id(service.adapter)}
+    # The same one is kept for the thread
+    assert service.session is service.session
+
+
+def test_stripe_client_uses_thread_sessions(monkeypatch):
+    service = OutboundService("test")
+    client = OutboundStripeClient(service)
+    used = []
+
+    def send(request, **kwargs):
+        used.append(service.session)
+        return respond(request)
+
+    monkeypatch.setattr(service.adapter, "send", send)
+    run_in_threads(lambda: client.request("get", "https://api.stripe.com/v1/balance", {}))
+    assert len(used) == 4
+    assert len({id(session) for session in used}) == 4
+    assert service.stats.as_dict()["calls"] == 4
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+from datetime import timedelta
+
+import pytest
+import requests
+from django.test import override_settings
+from django.utils import timezone
+
+from dds_registration.core.helpers.email import get_email_transport
+from dds_registration.models import Message, MessageDelivery, OutboxEmail, Registration
+
+
+def expire_claims(queryset, field: str = "next_attempt_at") -> None:
+    """Make the claims look as if their workers died long ago"""
+    queryset.update(**{field: timezone.now() - timedelta(seconds=1)})
+
+
+@pytest.fixture
+def failing_transport(outbox, monkeypatch):
+    def send(mail):
+        raise requests.ConnectionError("SendGrid is down")
+
+    monkeypatch.setattr(get_email_transport(), "send", send)
+
+
+def test_email_sent(outbox):
+    email = OutboxEmail.enqueue("ann@example.com", "Hello", "Message")
+    assert OutboxEmail.claim_next().send()
+    email.refresh_from_db()
+    assert email.status == "SENT"
+    assert email.sent_at
+    assert [mail["subject"] for mail in outbox] == ["Hello"]
+
+
+@override_settings(EMAIL_OUTBOX_RETRY_DELAY=60, EMAIL_OUTBOX_MAX_RETRY_DELAY=100)
+def test_failed_email_is_retried_later(failing_transport):
+    email = OutboxEmail.enqueue("ann@example.com", "Hello", "Message")
+    for attempt, delay in [(1, 60), (2, 100)]:
+        before = timezone.now()
+        assert not OutboxEmail.claim_next().send()
+        email.refresh_from_db()
+        assert email.status == "PENDING"
+        assert email.attempts == attempt
+        assert "SendGrid is down" in email.last_error
+        # Doubled after every failure, up to the max delay
+        assert before + timedelta(seconds=delay) <= email.next_attempt_at <= timezone.now() + timedelta(seconds=delay)
+        # Not due before the delay
+        assert OutboxEmail.claim_next() is None
+        expire_claims(OutboxEmail.objects.filter(id=email.id))
+
+
+@override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=3)
+def test_email_failed_after_max_attempts(failing_transport):
+    email = OutboxEmail.enqueue("ann@example.com", "Hello", "Message")
+    for _ in range(3):
+        assert not OutboxEmail.claim_next().send()
+        expire_claims(OutboxEmail.objects.filter(id=email.id))
+    email.refresh_from_db()
+    assert email.status == "FAILED"
+    assert email.attempts == 3
+    assert not email.sent_at
+    # Given up: not taken any more
+    assert OutboxEmail.claim_next() is None
+
+
+def test_email_claimed_once(db):
+    email = OutboxEmail.enqueue("ann@example.com", "Hello", "Message")
+    stale = OutboxEmail.objects.get(id=email.id)
+
+    claimed = OutboxEmail.claim_next()
+    assert claimed == email
+    assert claimed.attempts == 1
+    assert claimed.next_attempt_at > timezone.now()
+    # Another worker read it before the claim, and finds it taken
+    assert not stale.claim()
+    assert OutboxEmail.claim_next() is None
+
+
+def test_expired_email_claim_is_taken_again(db):
+    email = OutboxEmail.enqueue("ann@example.com", "Hello", "Message")
+    first = OutboxEmail.claim_next()
+    expire_claims(OutboxEmail.objects.filter(id=email.id))
+
+    second = OutboxEmail.claim_next()
+    assert second == email
+    assert second.attempts == 2
+    # The dead worker's copy can't claim it back
+    assert not first.claim()
+
+
+def test_expired_deliveries_are_sent_again(user, make_payment, outbox):
+    payment = make_payment()
+    message = Message.objects.create(event_id=payment.data["event"]["id"], subject="News", message="Hello")
+    assert message.enqueue() == 1
+    assert not outbox
+    assert list(Message.get_queued()) == [message]
+
+    batch = message.claim_deliveries(10)
+    assert [delivery.email for delivery in batch] == [user.email]
+    # Claimed by the first worker: nothing for the others
+    assert message.send_email() == 0
+    assert not outbox
+
+    expire_claims(MessageDelivery.objects.filter(message=message), "claimed_until")
+    assert message.send_email() == 1
+    assert len(outbox) == 1
+    assert message.emailed
+    assert not Message.get_queued().exists()
+
+
+def test_message_without_recipients_is_done(make_payment):
+    payment = make_payment()
+    Registration.objects.filter(event_id=payment.data["event"]["id"]).update(status="WITHDRAWN")
+    message = Message.objects.create(event_id=payment.data["event"]["id"], subject="News", message="Hello")
+    assert message.enqueue() == 0
+    assert message.emailed
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from django.db import IntegrityError
+
+from dds_registration import models
+from dds_registration.models import Registration, User
+
+
+@pytest.fixture
+def registration(make_payment):
+    return Registration.objects.get(id=make_payment().data["registration"]["id"])
+
+
+@pytest.fixture
+def other_user(db):
+    return User.objects.create(username="bob", email="bob@example.com", first_name="Bob", last_name="Jones")
+
+
+def test_taken_checkin_code_is_replaced(registration, other_user):
+    other = Registration(event=registration.event, user=other_user, status="REGISTERED")
+    other.checkin_code = registration.checkin_code
+    other.save()
+    assert other.checkin_code != registration.checkin_code
+    assert Registration.get_by_checkin_code(registration.event, other.checkin_code.lower()) == other
+
+
+def test_no_free_checkin_code(registration, other_user, monkeypatch):
+    monkeypatch.setattr(models, "random_checkin_code", lambda: registration.checkin_code)
+    other = Registration(event=registration.event, user=other_user, status="REGISTERED")
+    other.checkin_code = registration.checkin_code
+    with pytest.raises(IntegrityError):
+        other.save()
+    assert not Registration.objects.filter(user=other_user).exists()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import base64
+import json
+import time
+
+import pytest
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from django.test import Client, override_settings
+from django.urls import reverse
+from sendgrid.helpers.eventwebhook import EventWebhookHeader
+
+from dds_registration.core.helpers.email import send_broadcast
+from dds_registration.models import EmailSuppression, OutboxEmail
+
+private_key = ec.generate_private_key(ec.SECP256R1())
+# The verification key as shown in the SendGrid mail settings (the PEM content without the header lines)
+public_key = "".join(
+    private_key.public_key()
+    .public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+    .decode()
+    .splitlines()[1:-1]
+)
+
+events = [
+    {"email": "Ann@Example.com", "event": "bounce", "type": "bounce", "reason": "550 Unknown user"},
+    {"email": "bob@example.com", "event": "bounce", "type": "blocked"},
+    {"email": "carl@example.com", "event": "spamreport"},
+    {"email": "dan@example.com", "event": "delivered"},
+]
+
+
+def sign(payload: bytes, timestamp: str) -> str:
+    return base64.b64encode(private_key.sign(timestamp.encode() + payload, ec.ECDSA(hashes.SHA256()))).decode()
+
+
+def post_events(payload: bytes, signature: str, timestamp: str):
+    return Client().post(
+        reverse("sendgrid_events"),
+        payload,
+        content_type="application/json",
+        headers={EventWebhookHeader.SIGNATURE: signature, EventWebhookHeader.TIMESTAMP: timestamp},
+    )
+
+
+@pytest.fixture(autouse=True)
+def webhook_key():
+    with override_settings(SENDGRID_WEBHOOK_PUBLIC_KEY=public_key):
+        yield
+
+
+def test_signed_events_add_suppressions(db):
+    payload = json.dumps(events).encode()
+    timestamp = str(int(time.time()))
+    response = post_events(payload, sign(payload, timestamp), timestamp)
+    assert response.status_code == 204
+    assert dict(EmailSuppression.objects.values_list("email", "reason")) == {
+        "ann@example.com": "BOUNCE",
+        "bob@example.com": "BLOCKED",
+        "carl@example.com": "SPAMREPORT",
+    }
+
+
+def test_tampered_events_are_rejected(db):
+    payload = json.dumps(events).encode()
+    timestamp = str(int(time.time()))
+    signature = sign(payload, timestamp)
+    tampered = json.dumps(events[:1]).encode()
+    assert post_events(tampered, signature, timestamp).status_code == 403
+    # The signature covers the timestamp too
+    assert post_events(payload, signature, str(int(timestamp) + 1)).status_code == 403
+    assert post_events(payload, "", timestamp).status_code == 403
+    assert not EmailSuppression.objects.exists()
+
+
+@override_settings(SENDGRID_WEBHOOK_MAX_AGE=60)
+def test_old_events_are_rejected(db):
+    payload = json.dumps(events).encode()
+    for age, status in [(50, 204), (70, 403), (-70, 403)]:
+        timestamp = str(int(time.time()) - age)
+        assert post_events(payload, sign(payload, timestamp), timestamp).status_code == status
+
+
+def test_events_rejected_without_key(db):
+    payload = json.dumps(events).encode()
+    timestamp = str(int(time.time()))
+    with override_settings(SENDGRID_WEBHOOK_PUBLIC_KEY=""):
+        assert post_events(payload, sign(payload, timestamp), timestamp).status_code == 403
+
+
+def test_suppressed_recipients_are_skipped(user, outbox):
+    EmailSuppression.objects.create(email="ann@example.com", reason="BOUNCE")
+
+    user.email = "ANN@example.com"
+    user.email_user("Hello", "Message")
+    assert not OutboxEmail.objects.exists()
+
+    assert send_broadcast(["Ann@example.com", "bob@example.com"], "News", "Message") == 1
+    assert len(outbox) == 1
+    assert [to["email"] for to in outbox[0]["personalizations"][0]["to"]] == ["bob@example.com"]
+
+
+def test_email_suppressed_after_queued(outbox):
+    email = OutboxEmail.enqueue("ann@example.com", "Hello", "Message")
+    EmailSuppression.objects.create(email="ann@example.com", reason="SPAMREPORT")
+    assert OutboxEmail.claim_next().send()
+    email.refresh_from_db()
+    assert email.status == "SUPPRESSED"
+    assert not outbox
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import hmac
+import json
+import time
+
+import pytest
+import stripe
+from django.conf import settings
+from django.test import Client
+from django.urls import reverse
+
+from dds_registration.models import OutboxEmail, Payment, Registration, StripeEvent
+from dds_registration.views.helpers.stripe_payments import get_stripe_charge
+
+
+@pytest.fixture
+def stripe_payment(make_payment):
+    """A card payment, with the payment intent created by the payment page"""
+    payment = make_payment(method="STRIPE")
+    payment.data["stripe_intent_id"] = "pi_1"
+    payment.data["stripe_charge_in_progress"] = get_stripe_charge(payment.data)[1]
+    payment.save()
+    return payment
+
+
+def get_intent(payment: Payment, **data) -> dict:
+    return {
+        "id": payment.data["stripe_intent_id"],
+        "status": "succeeded",
+        "amount_received": get_stripe_charge(payment.data)[0],
+        "currency": payment.data["currency"].lower(),
+        "metadata": {"payment_id": str(payment.id)},
+        **data,
+    }
+
+
+def sign(payload: bytes, secret: str = settings.STRIPE_WEBHOOK_SECRET) -> str:
+    timestamp = int(time.time())
+    signature = hmac.new(secret.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def post_event(event: dict, signature: str | None = None):
+    payload = json.dumps(event).encode()
+    return Client().post(
+        reverse("stripe_events"),
+        payload,
+        content_type="application/json",
+        headers={"Stripe-Signature": signature or sign(payload)},
+    )
+
+
+def process_events() -> int:
+    count = 0
+    while event := StripeEvent.claim_next():
+        event.process()
+        count += 1
+    return count
+
+
+def succeeded_event(payment: Payment, event_id: str = "evt_1", **data) -> dict:
+    return {"id": event_id, "type": "payment_intent.succeeded", "data": {"object": get_intent(payment, **data)}}
+
+
+def test_payment_completed_by_webhook_event(stripe_payment):
+    assert post_event(succeeded_event(stripe_payment)).status_code == 200
+    # Only stored by the webhook
+    stripe_payment.refresh_from_db()
+    assert stripe_payment.status == "CREATED"
+
+    assert process_events() == 1
+    stripe_payment.refresh_from_db()
+    assert stripe_payment.status == "PAID"
+    assert stripe_payment.data["price"] == get_stripe_charge({**stripe_payment.data, "price": 100})[1]
+    assert "stripe_charge_in_progress" not in stripe_payment.data
+    registration = Registration.objects.get(id=stripe_payment.data["registration"]["id"])
+    assert registration.status == "REGISTERED"
+    assert StripeEvent.objects.get().status == "PROCESSED"
+
+
+def test_bad_signature_is_rejected(stripe_payment):
+    event = succeeded_event(stripe_payment)
+    payload = json.dumps(event).encode()
+    assert post_event(event, sign(payload, "whsec_other")).status_code == 403
+    assert post_event(event, "t=1,v1=0").status_code == 403
+    assert not StripeEvent.objects.exists()
+
+
+def test_duplicate_event_processed_once(stripe_payment):
+    event = succeeded_event(stripe_payment)
+    assert post_event(event).status_code == 200
+    assert post_event(event).status_code == 200
+    assert StripeEvent.objects.count() == 1
+    assert process_events() == 1
+    # Another event of the same intent (or a late one) doesn't complete the payment again
+    assert post_event(succeeded_event(stripe_payment, "evt_2")).status_code == 200
+    assert process_events() == 1
+    receipts = OutboxEmail.objects.filter(attachment_name__contains="receipt")
+    assert receipts.count() == 1
+
+
+@pytest.mark.parametrize(
+    "data, error",
+    [
+        ({"amount_received": 100}, "Received 100 EUR"),
+        ({"currency": "chf"}, "Received {amount} CHF"),
+    ],
+)
+def test_charge_mismatch_is_not_completed(stripe_payment, data, error):
+    event = StripeEvent.objects.create(
+        event_id="evt_1", type="payment_intent.succeeded", data=get_intent(stripe_payment)
+    )
+    amount = event.data["amount_received"]
+    event.data.update(data)
+    assert event.get_charge_mismatch(stripe_payment) == (f"{error.format(amount=amount)}, expected {amount} EUR")
+
+    event.save()
+    assert process_events() == 1
+    event.refresh_from_db()
+    assert event.status == "PROCESSED"
+    assert event.last_error.startswith(error.format(amount=amount))
+    stripe_payment.refresh_from_db()
+    assert stripe_payment.status == "CREATED"
+
+
+def test_payment_completed_on_return(user, stripe_payment, monkeypatch):
+    retrieved = []
+
+    def retrieve(intent_id, **kwargs):
+        retrieved.append(intent_id)
+        return stripe.PaymentIntent.construct_from(get_intent(stripe_payment), "key")
+
+    monkeypatch.setattr(stripe.PaymentIntent, "retrieve", retrieve)
+    client = Client()
+    client.force_login(user)
+    url = reverse("payment_stripe_success", args=(stripe_payment.id,))
+
+    assert client.get(url).status_code == 302
+    stripe_payment.refresh_from_db()
+    assert stripe_payment.status == "PAID"
+    assert StripeEvent.objects.get().event_id == "return-pi_1"
+
+    # Completed once: neither the page reload nor the late webhook event pay it again
+    assert client.get(url).status_code == 302
+    assert retrieved == ["pi_1"]
+    assert post_event(succeeded_event(stripe_payment)).status_code == 200
+    assert process_events() == 1
+    assert OutboxEmail.objects.filter(attachment_name__contains="receipt").count() == 1
+
+
+def test_payment_not_completed_on_return_before_success(user, stripe_payment, monkeypatch):
+    intent = stripe.PaymentIntent.construct_from(get_intent(stripe_payment, status="processing"), "key")
+    monkeypatch.setattr(stripe.PaymentIntent, "retrieve", lambda intent_id, **kwargs: intent)
+    client = Client()
+    client.force_login(user)
+    assert client.get(reverse("payment_stripe_success", args=(stripe_payment.id,))).status_code == 302
+    stripe_payment.refresh_from_db()
+    assert stripe_payment.status == "CREATED"
+    assert not StripeEvent.objects.exists()